@@ -0,0 +1,267 @@
+"""Check generated recipes against the avoid list and allergies.
+
+The prompt only asks Gemini to leave ingredients out, so every recipe is
+scanned afterwards.  Avoided items are expanded through an allergen synonym
+table ("dairy" also means butter, cream, cheese, ...) and the forms derived
+from each term ("buttered", "creamy", "cheesy"), then compiled together
+with known-safe phrases such as "coconut milk" into one Aho-Corasick
+automaton.  A scan is a single pass over the recipe text however many terms
+the table holds.  A few terms also count at the end of a compound word
+("cornbread", "sourdough", "codfish").
+"""
+
+from collections import deque
+from functools import lru_cache
+
+from ingredients import fold_ingredient, fold_words
+
+
+# Allergen -> terms that indicate it, and phrases containing those terms that don't
+ALLERGENS = {
+    "dairy": {
+        "terms": ["milk", "butter", "cream", "cheese", "yogurt", "yoghurt", "ghee", "whey", "casein", "lactose",
+                  "buttermilk", "parmesan", "mozzarella", "cheddar", "ricotta", "feta", "paneer", "mascarpone",
+                  "custard", "kefir", "creme fraiche", "crème fraîche", "half-and-half", "brie", "gouda",
+                  "halloumi", "burrata", "curd", "ice cream", "condensed milk", "evaporated milk", "sour cream",
+                  "quark", "skyr", "labneh", "gelato", "bechamel", "béchamel", "alfredo", "queso", "pecorino",
+                  "gruyere", "gruyère", "camembert", "emmental", "provolone", "manchego", "gorgonzola", "stilton",
+                  "roquefort", "cotija", "milkshake", "buttercream", "cheesecake", "tzatziki", "raita", "lassi"],
+        "safe": ["coconut milk", "coconut cream", "coconut yogurt", "almond milk", "oat milk", "soy milk",
+                 "rice milk", "cashew milk", "peanut butter", "almond butter", "cashew butter", "nut butter",
+                 "cocoa butter", "apple butter", "shea butter", "cream of tartar", "vegan butter",
+                 "vegan cheese", "vegan cream cheese", "plant-based milk", "plant-based butter",
+                 "non-dairy milk", "non-dairy creamer", "dairy-free cheese", "sunflower butter",
+                 "bean curd", "nutritional yeast"],
+    },
+    "egg": {
+        "terms": ["egg", "egg yolk", "egg white", "mayonnaise", "mayo", "meringue", "aioli", "albumen", "eggwash",
+                  "eggnog", "frittata", "omelette", "omelet", "hollandaise"],
+        "safe": ["eggplant", "egg-free mayo", "vegan mayo", "vegan mayonnaise", "flax egg", "chia egg"],
+    },
+    "peanut": {
+        "terms": ["peanut", "groundnut", "peanut butter", "peanut oil", "satay"],
+        "safe": [],
+    },
+    "tree nut": {
+        "terms": ["almond", "walnut", "cashew", "pecan", "pistachio", "hazelnut", "macadamia", "brazil nut",
+                  "pine nut", "nut", "praline", "marzipan", "nutella", "frangipane"],
+        "safe": ["nutmeg", "butternut", "butternut squash", "water chestnut", "coconut", "nut-free", "doughnut"],
+    },
+    "gluten": {
+        "terms": ["wheat", "flour", "bread", "breadcrumb", "panko", "pasta", "noodle", "spaghetti", "couscous",
+                  "barley", "rye", "semolina", "bulgur", "farro", "spelt", "seitan", "soy sauce", "tortilla",
+                  "pita", "cracker", "malt", "orzo", "udon", "beer", "dough", "naan", "penne", "macaroni", "lasagna",
+                  "lasagne", "fettuccine", "linguine", "rigatoni", "ravioli", "tortellini", "gnocchi", "ramen",
+                  "bagel", "croissant", "pastry", "brioche", "focaccia", "ciabatta", "baguette", "crouton",
+                  "dumpling", "wonton", "roux", "biscuit", "muffin", "pancake", "waffle", "doughnut", "donut",
+                  "pizza", "bun", "roti", "chapati", "paratha", "matzo", "graham"],
+        "safe": ["gluten-free flour", "gluten-free pasta", "gluten-free bread", "gluten-free soy sauce",
+                 "rice flour", "almond flour", "coconut flour", "corn flour", "cornflour", "chickpea flour",
+                 "buckwheat", "rice noodle", "glass noodle", "tamari", "corn tortilla", "rice paper",
+                 "zucchini noodle", "buckwheat flour", "oat flour", "sweetbread", "gluten-free dough"],
+    },
+    "shellfish": {
+        "terms": ["shrimp", "prawn", "crab", "lobster", "crayfish", "crawfish", "langoustine", "scallop",
+                  "clam", "mussel", "oyster", "squid", "calamari", "octopus", "shellfish"],
+        "safe": ["oyster mushroom", "oyster sauce-free"],
+    },
+    "fish": {
+        "terms": ["fish", "salmon", "tuna", "cod", "anchovy", "anchovies", "sardine", "mackerel", "trout",
+                  "tilapia", "halibut", "haddock", "bass", "fish sauce", "worcestershire"],
+        "safe": ["fish-free", "vegan fish sauce", "shellfish", "crayfish", "crawfish"],
+    },
+    "soy": {
+        "terms": ["soy", "soya", "tofu", "tempeh", "edamame", "miso", "soy sauce", "tamari", "soybean"],
+        "safe": [],
+    },
+    "sesame": {
+        "terms": ["sesame", "tahini", "sesame oil", "sesame seed", "za'atar", "gomasio"],
+        "safe": [],
+    },
+}
+
+# Everyday names for the allergen keys above
+ALLERGEN_ALIASES = {
+    "milk": "dairy",
+    "lactose": "dairy",
+    "dairy product": "dairy",
+    "eggs": "egg",
+    "peanuts": "peanut",
+    "nut": "tree nut",
+    "tree nuts": "tree nut",
+    "wheat": "gluten",
+    "crustacean": "shellfish",
+    "soybean": "soy",
+    "sesame seed": "sesame",
+}
+
+# Terms that also count at the end of a longer word: "cornbread", "wholewheat", "codfish"
+COMPOUND_ENDINGS = {"bread", "flour", "dough", "wheat", "fish"}
+_VOWELS = set("aeiou")
+
+# Names that cover several allergens at once
+ALLERGEN_GROUPS = {
+    "seafood": ("shellfish", "fish"),
+}
+
+
+class PatternMatcher:
+    """Aho-Corasick automaton over lowercase patterns."""
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern in patterns:
+            self._insert(pattern)
+        self._link()
+
+    def _insert(self, pattern):
+        state = 0
+        for char in pattern:
+            state = self._goto[state].setdefault(char, len(self._goto))
+            if state == len(self._goto):
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+        self._out[state].append(pattern)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def finditer(self, text):
+        """Yield ``(start, end, pattern)`` for every occurrence, overlaps included."""
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for pattern in self._out[state]:
+                yield i + 1 - len(pattern), i + 1, pattern
+
+
+def derived_forms(term):
+    """``term`` with the endings a recipe adds to it: "buttered", "creamy", "cheesy", "floured"."""
+    forms = {term}
+    # Words ending in other vowels ("pita", "mayo") don't take these endings
+    if " " in term or not term.isalpha() or term[-1] in _VOWELS - {"e"}:
+        return forms
+    if term.endswith("e"):
+        forms.add(term + "d")
+        if term.endswith("se"):
+            forms.add(term[:-1] + "y")
+    else:
+        forms |= {term + "ed", term + "y"}
+    return forms
+
+
+def _is_word_match(text, start, end, compound=False):
+    """Whole-word occurrence, allowing a plural "s"/"es" after the term.
+
+    ``compound`` terms may also end a longer word.
+    """
+    if start > 0 and text[start - 1].isalnum() and not compound:
+        return False
+    for suffix in ("", "s", "es"):
+        if text.startswith(suffix, end):
+            after = end + len(suffix)
+            if after == len(text) or not text[after].isalnum():
+                return True
+    return False
+
+
+def _is_free_of(text, start, end):
+    # "dairy-free", "egg free", "no-cheese" and "non-dairy" name the absence of the term
+    return text.startswith(("-free", " free"), end) or text.endswith(("no-", "non-"), 0, start)
+
+
+class AvoidListValidator:
+    """Finds avoided ingredients and allergens mentioned anywhere in a recipe.
+
+    A safe phrase only vouches for the item it belongs to: "almond milk"
+    hides the "milk" in it from a dairy check, never the "almond" from a
+    tree nut one.
+    """
+
+    def __init__(self, avoid_items):
+        # term -> avoided items it indicates; phrase -> avoided items it is safe for
+        self.forbidden = {}
+        self.safe = {}
+        for item in avoid_items:
+            label = item.strip()
+            key = fold_ingredient(label)
+            if not key:
+                continue
+            key = ALLERGEN_ALIASES.get(key, ALLERGEN_ALIASES.get(label.lower(), key))
+            allergens = [ALLERGENS[k] for k in ALLERGEN_GROUPS.get(key, (key,)) if k in ALLERGENS]
+            # The canonical name ("yogurt") and the spelling given ("yoghurt") are both searched for
+            terms = {key, fold_words(label)}
+            for allergen in allergens:
+                terms.update(term.lower() for term in allergen["terms"])
+            for term in terms:
+                for form in derived_forms(term):
+                    labels = self.forbidden.setdefault(form, [])
+                    if label not in labels:
+                        labels.append(label)
+            for allergen in allergens:
+                for phrase in allergen["safe"]:
+                    if phrase.lower() not in terms:
+                        self.safe.setdefault(phrase.lower(), set()).add(label)
+        self._matcher = PatternMatcher(set(self.forbidden) | set(self.safe))
+
+    def __bool__(self):
+        return bool(self.forbidden)
+
+    def scan(self, text):
+        """``{avoided item: term}`` for every avoided item found in ``text``."""
+        text = text.lower()
+        safe_spans = []
+        hits = []
+        for start, end, pattern in self._matcher.finditer(text):
+            if not _is_word_match(text, start, end, pattern in COMPOUND_ENDINGS):
+                continue
+            if pattern in self.safe:
+                safe_spans.append((start, end, self.safe[pattern]))
+            if pattern in self.forbidden:
+                hits.append((start, end, pattern))
+
+        found = {}
+        for start, end, term in hits:
+            if _is_free_of(text, start, end):
+                continue
+            for label in self.forbidden[term]:
+                if label in found:
+                    continue
+                if not any(s <= start and end <= e and label in labels for s, e, labels in safe_spans):
+                    found[label] = term
+        return found
+
+    def violations(self, recipe):
+        parts = [recipe.title, recipe.description, recipe.markdown]
+        parts += [i.name for i in recipe.ingredients]
+        parts += list(recipe.steps)
+        return self.scan("\n".join(p for p in parts if p))
+
+
+@lru_cache(maxsize=256)
+def _compiled(avoid_items):
+    return AvoidListValidator(avoid_items)
+
+
+def validator_for(avoid_items):
+    """Cached validator for an avoid list, or ``None`` when nothing is avoided."""
+    validator = _compiled(tuple(sorted({i.strip().lower() for i in avoid_items if i and i.strip()})))
+    return validator or None
+
+
+def describe(violations):
+    return ", ".join(f"{term} ({item})" if term != item.lower() else term for item, term in violations.items())
@@ -1,12 +1,28 @@
 import streamlit as st
-import google.generativeai as genai
-import json
+import math
 import os
 import random
-from datetime import datetime
+import tempfile
+import time
+import uuid
 import pandas as pd
 import plotly.express as px
 
+from cache import ResponseCache, make_cache_key
+from gemini_client import BACKEND, friendly_error, get_client, route_model
+from allergens import validator_for
+from archive import export_archive, import_archive
+from cookbook import CookbookRenderer
+from ingredients import canonical_ingredients, fold_ingredient, fold_words, load_vocabulary
+from generation import DEFAULT_PROFILE, MODEL_NAME, PROFILES, build_prompt, fan_out_into, generate_into, profile_cache_id, recipe_generation_config, repair_into, stream_into
+from jobs import FAILED, QUEUED, RUNNING, JobManager
+from matcher import LibraryIndex
+from metrics import METRICS, inc, observe, serve_prometheus, span
+from storage import RecipeStore
+from similarity import DEFAULT_THRESHOLD, SimilarityIndex, constraint_key
+from recipes import dump_recipes, parse_recipes, to_markdown
+from vision import DetectionCache, GeminiDetector, StubDetector, detect_ingredients
+
 
 # --- Page Config ---
 st.set_page_config(
@@ -16,12 +32,35 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Timed until the end of the script; reruns cut short by st.rerun() aren't recorded
+rerun_started = time.perf_counter()
+
 # --- App State Management ---
+ALLERGY_OPTIONS = ["Peanuts", "Tree Nuts", "Dairy", "Eggs", "Seafood", "Gluten", "Soy"]
+CUISINE_OPTIONS = ["Italian", "Chinese", "Indian", "Mexican", "American", "Mediterranean", "Japanese", "Thai", "French"]
+SKILL_LEVELS = ["Beginner", "Intermediate", "Advanced"]
+
+def clean_profile(data):
+    """A user profile with malformed or unknown values (e.g. from an import) replaced by the defaults."""
+    def known(values, options):
+        return [v for v in values if v in options] if isinstance(values, list) else []
+    return {
+        "allergies": known(data.get("allergies"), ALLERGY_OPTIONS),
+        "preferred_cuisines": known(data.get("preferred_cuisines"), CUISINE_OPTIONS),
+        "skill_level": data.get("skill_level") if data.get("skill_level") in SKILL_LEVELS else SKILL_LEVELS[0]
+    }
+
 def init_session_state():
-    if 'favorites' not in st.session_state:
-        st.session_state.favorites = []
-    if 'recipe_history' not in st.session_state:
-        st.session_state.recipe_history = []
+    if 'user_id' not in st.session_state:
+        # The library id lives in the URL so a bookmark brings the user back to their recipes
+        if "user" not in st.query_params:
+            st.query_params["user"] = uuid.uuid4().hex[:12]
+        st.session_state.user_id = st.query_params["user"]
+    if 'results' not in st.session_state:
+        st.session_state.results = {}
+    if 'cookbook_ids' not in st.session_state:
+        # Favorites ticked for the cookbook, kept across Browser pages
+        st.session_state.cookbook_ids = set()
     if 'theme' not in st.session_state:
         st.session_state.theme = "light"
     if 'user_profile' not in st.session_state:
@@ -33,6 +72,118 @@ def init_session_state():
 
 init_session_state()
 
+PARALLEL_TIMEOUT = 45  # seconds allowed for each fan-out request
+
+# --- Response Cache (shared across sessions) ---
+@st.cache_resource
+def get_response_cache():
+    cache = ResponseCache()
+    METRICS.gauge("response_cache_entries", lambda: cache.stats()["entries"], "Entries in the shared response cache")
+    METRICS.gauge("response_cache_hit_rate", lambda: cache.stats()["hit_rate"], "Lifetime hit rate of the response cache")
+    return cache
+
+response_cache = get_response_cache()
+
+@st.cache_resource
+def get_similarity_index():
+    return SimilarityIndex()
+
+similarity_index = get_similarity_index()
+
+# --- Ingredient Vocabulary (loaded and indexed once per process) ---
+@st.cache_resource
+def get_vocabulary():
+    return load_vocabulary()
+
+vocabulary = get_vocabulary()
+
+# --- Recipe Storage (favorites and history) ---
+@st.cache_resource
+def get_recipe_store():
+    return RecipeStore()
+
+store = get_recipe_store()
+user_id = st.session_state.user_id
+
+# --- Library Matcher ("cook from my library first") ---
+@st.cache_resource
+def get_library_index():
+    recipe_store = get_recipe_store()
+    return LibraryIndex(lambda uid: filter(None, map(recipe_store.get_recipe, recipe_store.iter_user_recipe_ids(uid))))
+
+library_index = get_library_index()
+
+# --- Background Generation Jobs (shared worker pool) ---
+@st.cache_resource
+def get_job_manager():
+    manager = JobManager(max_workers=int(os.environ.get("FRIDGEFEAST_MAX_CONCURRENT_JOBS", 4)))
+    METRICS.gauge("generation_jobs_running", lambda: manager.stats()[RUNNING], "Generation jobs currently running")
+    METRICS.gauge("generation_jobs_queued", lambda: manager.stats()[QUEUED], "Generation jobs waiting for a worker")
+    return manager
+
+job_manager = get_job_manager()
+
+# --- Photo Detections (shared by content hash; near matches stay per user) ---
+@st.cache_resource
+def get_detection_cache():
+    return DetectionCache()
+
+detection_cache = get_detection_cache()
+
+# --- Cookbook PDFs (layouts cached by recipe content hash) ---
+@st.cache_resource
+def get_cookbook_renderer():
+    return CookbookRenderer()
+
+cookbook = get_cookbook_renderer()
+
+# --- Metrics endpoint (optional, for Prometheus scraping) ---
+@st.cache_resource
+def start_metrics_server():
+    port = os.environ.get("FRIDGEFEAST_METRICS_PORT")
+    return serve_prometheus(int(port)) if port else None
+
+start_metrics_server()
+
+SIDEBAR_PAGE_SIZE = 10
+BROWSER_PAGE_SIZES = [12, 24, 48]
+HISTORY_LIMIT = 100
+HISTORY_DAYS = 90
+TOP_INGREDIENTS = 5
+LIBRARY_MATCHES = 3
+INGREDIENT_MATCHES = 12
+
+# --- History analytics ---
+@st.cache_data(max_entries=256)
+def history_analytics(user_id, version):
+    """Daily rollups and top ingredients; ``version`` changes whenever the user's history does."""
+    daily = pd.DataFrame(store.history_daily(user_id, days=HISTORY_DAYS))
+    return daily, store.top_ingredients(user_id, TOP_INGREDIENTS)
+
+# --- Pagination ---
+def page_controls(key, total, page_size):
+    """Render Prev/Next controls and return the row offset of the current page."""
+    pages = max(1, math.ceil(total / page_size))
+    page = min(st.session_state.get(key, 1), pages)
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("◀", key=f"{key}_prev", disabled=page <= 1):
+            page -= 1
+    with col3:
+        if st.button("▶", key=f"{key}_next", disabled=page >= pages):
+            page += 1
+    with col2:
+        st.caption(f"Page {page} of {pages}")
+    
+    st.session_state[key] = page
+    return (page - 1) * page_size
+
+# --- Cookbook Selection ---
+def toggle_cookbook(recipe_id):
+    # Checkboxes on other pages aren't rendered, so the selection lives outside widget state
+    st.session_state.cookbook_ids ^= {recipe_id}
+
 # --- Theme Switcher ---
 def toggle_theme():
     st.session_state.theme = "dark" if st.session_state.theme == "light" else "light"
@@ -84,42 +235,55 @@ with st.sidebar:
     with st.expander("🔑 API Settings", expanded=False):
         api_key = st.text_input("Enter your Gemini API Key", type="password")
         st.caption("Your API key is never stored and only used for recipe generation.")
+        if BACKEND == "mock":
+            st.caption("🧪 Using the local mock backend; no API key needed.")
+            api_key = api_key or "mock"
         
     # User Profile
     with st.expander("👤 User Profile", expanded=False):
         st.session_state.user_profile["allergies"] = st.multiselect(
             "Food allergies/restrictions:",
-            ["Peanuts", "Tree Nuts", "Dairy", "Eggs", "Seafood", "Gluten", "Soy"],
+            ALLERGY_OPTIONS,
             st.session_state.user_profile.get("allergies", [])
         )
         
         st.session_state.user_profile["preferred_cuisines"] = st.multiselect(
             "Favorite cuisines:",
-            ["Italian", "Chinese", "Indian", "Mexican", "American", "Mediterranean", "Japanese", "Thai", "French"],
+            CUISINE_OPTIONS,
             st.session_state.user_profile.get("preferred_cuisines", [])
         )
         
         st.session_state.user_profile["skill_level"] = st.select_slider(
             "Cooking skill level:",
-            options=["Beginner", "Intermediate", "Advanced"],
+            options=SKILL_LEVELS,
             value=st.session_state.user_profile.get("skill_level", "Beginner")
         )
+        
+        st.caption(f"Library ID: `{user_id}` — bookmark this page to come back to your saved recipes.")
     
     # Favorites Expander
     with st.expander("⭐ Saved Recipes", expanded=False):
-        if st.session_state.favorites:
-            for i, fav in enumerate(st.session_state.favorites):
+        favorite_count = store.count_favorites(user_id)
+        if favorite_count:
+            offset = page_controls("sidebar_page", favorite_count, SIDEBAR_PAGE_SIZE) if favorite_count > SIDEBAR_PAGE_SIZE else 0
+            for fav in store.list_favorites(user_id, limit=SIDEBAR_PAGE_SIZE, offset=offset):
                 col1, col2 = st.columns([3, 1])
                 with col1:
                     st.write(f"**{fav['title']}**")
                 with col2:
-                    if st.button("🗑️", key=f"delete_{i}"):
-                        st.session_state.favorites.pop(i)
+                    if st.button("🗑️", key=f"delete_{fav['id']}"):
+                        store.delete_favorite(user_id, fav["id"])
+                        library_index.reset(user_id)
                         st.rerun()
             
             # Export favorites
             if st.button("📥 Export Favorites"):
-                df = pd.DataFrame(st.session_state.favorites)
+                df = pd.DataFrame([{
+                    "title": fav["title"],
+                    "ingredients": fav["ingredients"],
+                    "date_saved": fav["date_saved"],
+                    "content": to_markdown(store.get_recipe(fav["id"]))
+                } for fav in store.iter_favorites(user_id)])
                 csv = df.to_csv(index=False).encode('utf-8')
                 st.download_button(
                     "📥 Download CSV",
@@ -133,18 +297,31 @@ with st.sidebar:
     
     # Recipe History
     with st.expander("📜 Recipe History", expanded=False):
-        if st.session_state.recipe_history:
+        # Charts read the per-day rollups kept up to date on every write, not the history rows
+        daily, top_ingredients = history_analytics(user_id, store.history_version(user_id))
+        if not daily.empty:
+            timed = daily['latency_count'].sum()
+            col1, col2 = st.columns(2)
+            col1.metric("Recipes", int(daily['recipes'].sum()))
+            col2.metric("Avg. wait", f"{daily['latency_sum'].sum() / timed:.1f}s" if timed else "—")
+            if top_ingredients:
+                st.caption("Top ingredients: " + ", ".join(f"{name} ({uses})" for name, uses in top_ingredients))
+            
+            recipe_history = store.list_history(user_id, limit=HISTORY_LIMIT)
             history_df = pd.DataFrame({
-                'Date': [h['date'] for h in st.session_state.recipe_history],
-                'Ingredients': [h['ingredients'] for h in st.session_state.recipe_history],
-                'Count': [len(h.get('recipes', [])) for h in st.session_state.recipe_history]
+                'Date': [h['date'] for h in recipe_history],
+                'Ingredients': [h['ingredients'] for h in recipe_history],
+                'Cuisine': [h['cuisine'] for h in recipe_history],
+                'Diet': [h['diet'] for h in recipe_history],
+                'Count': [h['recipe_count'] for h in recipe_history],
+                'Seconds': [round(h['latency'], 1) if h['latency'] is not None else None for h in recipe_history]
             })
             st.dataframe(history_df)
             
             # Visualization
-            if len(history_df) > 1:
+            if len(daily) > 1:
                 st.subheader("Your Recipe Journey")
-                fig = px.line(history_df, x='Date', y='Count', title='Recipes Generated Over Time')
+                fig = px.line(daily, x='day', y='recipes', labels={'day': 'Day', 'recipes': 'Recipes'}, title='Recipes Generated per Day')
                 st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("Generate recipes to see history!")
@@ -158,14 +335,6 @@ with tab1:
     #### *Turn your fridge into a feast with AI-generated recipes!*
     """)
 
-    # Camera input for future ingredient detection
-    with st.expander("📸 Scan Ingredients (Coming Soon)", expanded=False):
-        st.camera_input("Take a picture of your ingredients")
-        st.info("AI-powered ingredient detection coming soon! For now, please enter ingredients manually below.")
-
-    # --- Ingredients Input ---
-    st.subheader("🥕 What's in your fridge?")
-    
     # Enhanced ingredient selection
     ingredient_categories = {
         "Proteins": ["chicken", "beef", "pork", "tofu", "eggs", "beans", "lentils", "chickpeas"],
@@ -175,6 +344,48 @@ with tab1:
         "Others": ["olive oil", "garlic", "lemon", "soy sauce", "honey", "mayo"]
     }
     
+    # --- Ingredient Scan ---
+    with st.expander("📸 Scan Ingredients", expanded=False):
+        photo = st.camera_input("Take a picture of your ingredients") or st.file_uploader("...or upload a photo", type=["jpg", "jpeg", "png", "webp"])
+        # Only a new photo is processed; reruns with the same one reuse the last result
+        if photo is not None and photo.file_id != st.session_state.get("scanned_photo"):
+            if not api_key:
+                st.warning("Please enter your Gemini API key in the sidebar to scan photos.")
+            else:
+                try:
+                    with st.spinner("Looking for ingredients..."):
+                        detector = StubDetector() if BACKEND == "mock" else GeminiDetector(get_client(api_key, MODEL_NAME))
+                        scan = detect_ingredients(photo.getvalue(), detector, detection_cache, scope=user_id)
+                    st.session_state.scanned_photo = photo.file_id
+                    st.session_state.scan_result = scan
+                    
+                    # Pre-fill the pickers below: presets get ticked, anything else joins the custom list
+                    presets = {fold_ingredient(item): item for items in ingredient_categories.values() for item in items}
+                    custom = [i.strip() for i in st.session_state.get("custom_ingredients", "").split(",") if i.strip()]
+                    searched = st.session_state.get("ingredient_search", [])
+                    for name in map(vocabulary.normalize, scan["ingredients"]):
+                        preset = presets.get(fold_ingredient(name))
+                        if preset:
+                            st.session_state[f"ing_{preset}"] = True
+                            searched = searched + [preset] if preset not in searched else searched
+                        elif name not in custom:
+                            custom.append(name)
+                    st.session_state.ingredient_search = searched
+                    st.session_state.custom_ingredients = ", ".join(custom)
+                except Exception as e:
+                    st.error(friendly_error(e))
+        
+        scan = st.session_state.get("scan_result")
+        if photo is not None and scan:
+            if scan["ingredients"]:
+                st.success("Found: " + ", ".join(scan["ingredients"]))
+            else:
+                st.info("No ingredients recognised; try a closer, well-lit photo.")
+            st.caption("♻️ Same fridge as an earlier photo; reused its result" if scan["cached"] else f"Sent {scan['sent_bytes'] / 1024:.0f} KB (photo was {scan['original_bytes'] / 1024:.0f} KB)")
+
+    # --- Ingredients Input ---
+    st.subheader("🥕 What's in your fridge?")
+    
     selected_tab = st.radio("Select by:", ["Categories", "Search"], horizontal=True)
     
     if selected_tab == "Categories":
@@ -188,12 +399,24 @@ with tab1:
                     if st.checkbox(item, key=f"ing_{item}"):
                         selected_ingredients.append(item)
     else:
-        preset_items = sum(ingredient_categories.values(), [])
-        selected_ingredients = st.multiselect("Search ingredients:", preset_items)
+        # Type-ahead over the whole vocabulary; earlier picks stay listed as the matches change
+        picked = st.session_state.get("ingredient_search", [])
+        ingredient_query = st.text_input("Search ingredients:", key="ingredient_query", placeholder="Start typing, e.g. chick or aubergine")
+        matches = vocabulary.search(ingredient_query, limit=INGREDIENT_MATCHES)
+        st.session_state.ingredient_search = picked
+        selected_ingredients = st.multiselect("Pick ingredients:", list(dict.fromkeys(picked + matches)), key="ingredient_search")
+        if ingredient_query and not matches:
+            st.caption("Not in the ingredient list; add it as a custom ingredient below.")
     
-    custom_ingredients = st.text_input("Add any custom ingredients (comma-separated):")
+    custom_ingredients = st.text_input("Add any custom ingredients (comma-separated):", key="custom_ingredients")
     
-    all_ingredients = selected_ingredients + [i.strip() for i in custom_ingredients.split(",") if i.strip()]
+    # Custom entries are mapped to canonical names, so "Aubergines" and "eggplant" build the same prompt and cache key
+    custom_items = [(raw.strip(), vocabulary.normalize(raw)) for raw in custom_ingredients.split(",") if raw.strip()]
+    renamed = [f"{raw} → {name}" for raw, name in custom_items if fold_words(raw) != fold_words(name)]
+    if renamed:
+        st.caption("Matched to known ingredients: " + ", ".join(renamed))
+    
+    all_ingredients = canonical_ingredients(selected_ingredients + [name for _, name in custom_items])
     ingredient_str = ", ".join(all_ingredients)
     
     # Display selected ingredients as pills
@@ -212,6 +435,8 @@ with tab1:
     
     avoided_ingredient_list = [i.strip() for i in avoided_ingredients.split(",") if i.strip()] + st.session_state.user_profile.get("allergies", [])
     avoided_ingredient_str = ", ".join(avoided_ingredient_list)
+    # Generated recipes are checked against this, allergen synonyms included
+    avoid_validator = validator_for(avoided_ingredient_list)
 
     # --- Preferences ---
     col1, col2, col3, col4 = st.columns(4)
@@ -240,60 +465,25 @@ with tab1:
         with col2:
             skill_required = st.selectbox("Skill level required", ["Any", "Beginner", "Intermediate", "Advanced"])
             calories = st.selectbox("Calories", ["Any", "Low-calorie", "Medium-calorie", "High-calorie"])
-    
-    # --- Prompt Builder ---
-    def build_prompt(ingredients, avoid_ingredients, cuisine, meal_type, diet, count, user_profile, advanced_options=None):
-        prompt = f"""
-You are a creative and friendly recipe assistant. Create {count} unique, simple, and delicious recipes based on the following ingredients: {ingredients}.
-
-Each recipe MUST include:
-- A creative and engaging title
-- A short description (2-3 sentences)
-- A clear list of ingredients with quantities
-- Easy-to-follow instructions (step-by-step)
-- Estimated cooking time
-- Difficulty level
-- Calories estimate (per serving)
-- Servings
-
-Present each recipe in a clean, simple markdown format. Use ## headings for recipe titles and single # only for the main sections. Use bullet points for ingredients and numbered lists for instructions.
-
-If specified, avoid using these ingredients: {avoid_ingredients}.
-"""
-        # Add cuisine preference
-        if cuisine != "Any":
-            prompt += f"The recipes should follow {cuisine} cuisine.\n"
-        elif user_profile.get("preferred_cuisines"):
-            prompt += f"Consider these favorite cuisines if relevant: {', '.join(user_profile['preferred_cuisines'])}.\n"
-        
-        # Add meal type
-        if meal_type != "Any":
-            prompt += f"The recipes should be suitable for {meal_type.lower()}.\n"
-        
-        # Add dietary preference
-        if diet != "None":
-            prompt += f"All recipes must follow a {diet.lower()} diet.\n"
-        
-        # Advanced options
-        if advanced_options:
-            if advanced_options.get("cooking_time") and advanced_options["cooking_time"] != "Any":
-                prompt += f"Recipes should be prepared {advanced_options['cooking_time'].lower()}.\n"
-            
-            if advanced_options.get("spice_level"):
-                spice_desc = ["very mild", "mild", "medium", "spicy", "very spicy"][advanced_options["spice_level"]-1]
-                prompt += f"Spice level should be {spice_desc}.\n"
-            
-            if advanced_options.get("skill_required") and advanced_options["skill_required"] != "Any":
-                prompt += f"Recipes should be appropriate for {advanced_options['skill_required'].lower()} cooks.\n"
-            elif user_profile.get("skill_level"):
-                prompt += f"Assume the cook has {user_profile['skill_level'].lower()} skill level.\n"
-            
-            if advanced_options.get("calories") and advanced_options["calories"] != "Any":
-                prompt += f"Recipes should be {advanced_options['calories'].lower()}.\n"
         
-        prompt += "Separate recipes with a horizontal rule (---). Make the output fun and engaging."
-        return prompt
-
+        structured_output = st.checkbox("🧾 Structured recipes", value=True, help="Asks Gemini for recipes as JSON so every card has the same layout.")
+        
+        generation_mode = st.radio(
+            "Generation mode",
+            ["Streaming", "Parallel", "Single request"],
+            horizontal=True,
+            help="Streaming renders each recipe as soon as it is written. Parallel asks for every recipe in its own concurrent request."
+        )
+        
+        profile_name = st.radio(
+            "Generation profile",
+            list(PROFILES),
+            index=list(PROFILES).index(DEFAULT_PROFILE),
+            format_func=str.title,
+            horizontal=True,
+            help="Fast uses a lighter model and terse recipes. Rich allows longer, more detailed recipes. Single recipes and surprises use the lighter model unless you pick Rich."
+        )
+    
     # Collect advanced options
     advanced_options = {
         "cooking_time": cooking_time,
@@ -302,76 +492,247 @@ If specified, avoid using these ingredients: {avoid_ingredients}.
         "calories": calories
     }
 
+    # --- Cook From My Library ---
+    # Saved and earlier recipes that fit this fridge, ranked before paying for a new generation
+    with span("library_match_seconds"):
+        library_matches = library_index.rank(user_id, all_ingredients, avoided_ingredient_list, limit=2 * LIBRARY_MATCHES) if all_ingredients else []
+    # The matrix only knows ingredient names; allergen synonyms ("dairy" -> butter) are checked here
+    library_matches = [m for m in library_matches if not (avoid_validator and avoid_validator.violations(m["recipe"]))][:LIBRARY_MATCHES]
+    if library_matches:
+        st.markdown("#### 📚 Cook from my library first")
+        st.caption("Recipes you've already saved or generated that fit what you have. Generate below for something new.")
+        for match in library_matches:
+            recipe = match["recipe"]
+            with st.expander(f"{recipe.title} — {match['coverage']:.0%} of its ingredients on hand"):
+                if match["missing"]:
+                    st.caption(f"Missing: {', '.join(match['missing'])}")
+                else:
+                    st.caption("You have everything for this one.")
+                st.markdown(to_markdown(recipe))
+
     # --- Recipe Generation Actions ---
+    # Generations run as background jobs; the session only remembers the job id
+    active_job = st.session_state.get("active_job")
+    
     col1, col2 = st.columns(2)
     
     with col1:
-        generate_button = st.button("🍳 Generate My Recipes", type="primary", use_container_width=True)
+        generate_button = st.button("🍳 Generate My Recipes", type="primary", use_container_width=True, disabled=active_job is not None)
     
     with col2:
-        surprise_button = st.button("🎲 Surprise Me!", use_container_width=True)
+        surprise_button = st.button("🎲 Surprise Me!", use_container_width=True, disabled=active_job is not None)
 
-    # Configure API if key provided
-    if api_key:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.0-flash")
+    profile = PROFILES[profile_name]
+    profile_id = profile_cache_id(profile_name)
 
-    # Generate recipes based on inputs
-    if generate_button and ingredient_str and api_key:
-        prompt = build_prompt(ingredient_str, avoided_ingredient_str, cuisine, meal_type, diet, recipe_count, st.session_state.user_profile, advanced_options)
+    def routed_model(count, surprise=False):
+        # Shared per-key clients; configured once per process, not on every rerun
+        return get_client(api_key, route_model(profile, count, surprise=surprise))
+
+    def render_recipe_card(recipe, ingredients, key_prefix=""):
+        key = f"{key_prefix}{recipe.id}"
+        content = to_markdown(recipe)
         
-        with st.spinner("Cooking up some recipe magic with Gemini..."):
-            try:
-                response = model.generate_content(prompt)
+        with st.container():
+            st.markdown('<div class="recipe-card">', unsafe_allow_html=True)
+            
+            col1, col2 = st.columns([5, 1])
+            
+            with col1:
+                st.markdown(content)
+            
+            with col2:
+                # Save button
+                if store.is_favorite(user_id, recipe.id):
+                    st.button("✅ Saved", key=f"save_{key}", disabled=True)
+                elif st.button("⭐ Save", key=f"save_{key}"):
+                    store.add_favorite(user_id, recipe, ingredients)
+                    library_index.add(user_id, [recipe])
+                    st.success(f"Saved {recipe.title}!")
                 
-                # Add to history
-                st.session_state.recipe_history.append({
-                    "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
+                # Share button
+                share_clicked = st.button("📤 Share", key=f"share_{key}")
+                    
+                # Print button
+                st.download_button(
+                    "🖨️ Print",
+                    cookbook.recipe_pdf(recipe),
+                    f"{recipe.title}.pdf",
+                    "application/pdf",
+                    key=f"print_{key}"
+                )
+            
+            if share_clicked:
+                st.code(content, language="markdown")
+                st.caption("Copy the recipe above to share it.")
+            
+            st.markdown('</div>', unsafe_allow_html=True)
+
+    def render_results(kind, key_prefix=""):
+        result = st.session_state.results.get(kind)
+        if not result:
+            return
+        
+        st.markdown(result["heading"])
+        if result.get("caption"):
+            st.caption(result["caption"])
+        if result.get("error"):
+            st.error(result["error"])
+        for note in result.get("notes", []):
+            st.warning(note)
+        if result.get("similar") and st.button("🔄 Generate fresh recipes instead", key=f"fresh_{kind}"):
+            st.session_state.force_fresh = True
+            st.rerun()
+        with span("render_seconds", view=kind):
+            for recipe in result["recipes"]:
+                render_recipe_card(recipe, result["ingredients"], key_prefix)
+
+    def find_similar(ingredients, constraint):
+        """Cached recipes of the closest earlier fridge above the similarity threshold."""
+        threshold = st.session_state.get("similarity_threshold", DEFAULT_THRESHOLD)
+        with span("similarity_lookup_seconds"):
+            matches = similarity_index.lookup(ingredients, constraint, threshold)
+        for score, key in matches:
+            cached = response_cache.get(key)
+            if cached is not None:
+                inc("similar_fridge_lookups_total", result="hit")
+                return score, parse_recipes(cached)
+            similarity_index.discard(key)
+        inc("similar_fridge_lookups_total", result="miss")
+        return None, None
+
+    def generation_job(runner, model, *args, cache_key=None, similar_key=None, repair_prompt=None):
+        """Bind a generation runner into a job function; complete batches are cached."""
+        validator = avoid_validator
+        repair_config = recipe_generation_config(structured_output, profile, 1)
+        
+        def run(job):
+            job.validator = validator
+            runner(job, model, *args)
+            # Recipes that slipped an avoided ingredient in are regenerated one by one
+            if job.rejected and not job.cancelled:
+                repair_into(job, model, repair_prompt, repair_config, timeout=PARALLEL_TIMEOUT, format_error=friendly_error)
+            # Partial fan-out batches and cancelled jobs are shown but not cached
+            if cache_key and job.recipes and not job.notes and not job.cancelled:
+                response_cache.put(cache_key, dump_recipes(job.recipes), model.model_name)
+                if similar_key:
+                    similarity_index.add(cache_key, *similar_key)
+        return run
+
+    def start_job(kind, run, heading, ingredients, caption=None, key=None, key_prefix=""):
+        st.session_state.active_job = {
+            "id": job_manager.submit(run, key=key),
+            "kind": kind,
+            "heading": heading,
+            "caption": caption,
+            "ingredients": ingredients,
+            "cuisine": cuisine,
+            "diet": diet,
+            "key_prefix": key_prefix
+        }
+
+    def finish_job(active, recipes, notes, error=None, latency=None):
+        st.session_state.results[active["kind"]] = {
+            "heading": active["heading"],
+            "caption": active["caption"],
+            "notes": notes,
+            "error": error,
+            "ingredients": active["ingredients"],
+            "recipes": recipes
+        }
+        if active["kind"] == "generate" and recipes:
+            store.add_history(user_id, active["ingredients"], recipes, cuisine=active["cuisine"], diet=active["diet"], latency=latency)
+            library_index.add(user_id, recipes)
+        st.session_state.pop("active_job", None)
+
+    @st.fragment(run_every=0.5)
+    def show_active_job():
+        # Polls the job so only this block reruns while Gemini is working
+        active = st.session_state.get("active_job")
+        if not active:
+            return
+        job = job_manager.get(active["id"])
+        if job is None:
+            finish_job(active, [], [], "The generation was lost; please try again.")
+            st.rerun()
+        
+        # Read ``finished`` first: a job that completes between the two reads
+        # would otherwise be reported with the recipes from before it finished
+        finished = job.finished
+        recipes, notes, preview = job.snapshot()
+        if finished:
+            error = friendly_error(job.error) if job.status == FAILED else None
+            finish_job(active, recipes, notes, error, latency=job.finished_at - job.created_at)
+            st.rerun()
+        
+        st.markdown(active["heading"])
+        if active["caption"]:
+            st.caption(active["caption"])
+        for note in notes:
+            st.warning(note)
+        with span("render_seconds", view="job"):
+            for recipe in recipes:
+                render_recipe_card(recipe, active["ingredients"], active["key_prefix"])
+        if preview.strip():
+            st.markdown(preview)
+        
+        col1, col2 = st.columns([5, 1])
+        with col1:
+            st.caption("⏳ Waiting for a free worker..." if job.status == QUEUED else "🍳 Cooking up some recipe magic with Gemini...")
+        with col2:
+            if st.button("✋ Cancel", key=f"cancel_{job.id}"):
+                # Keep whatever already arrived; the worker stops at its next checkpoint
+                job_manager.cancel(job.id)
+                finish_job(active, recipes, notes + ["Generation cancelled."], latency=time.time() - job.created_at)
+                st.rerun()
+
+    # "Generate fresh recipes" skips the similar-fridge lookup for one run
+    fresh_requested = st.session_state.pop("force_fresh", False)
+
+    # Generate recipes based on inputs
+    if (generate_button or fresh_requested) and ingredient_str and api_key:
+        cache_key = make_cache_key(all_ingredients, avoided_ingredient_list, cuisine, meal_type, diet, recipe_count, st.session_state.user_profile, advanced_options, profile_id, structured=structured_output)
+        constraint = constraint_key(avoided_ingredient_list, cuisine, meal_type, diet, recipe_count, st.session_state.user_profile, advanced_options, profile_id, structured=structured_output)
+        heading = "## 📖 Your AI-Powered Recipes:"
+        
+        try:
+            cached = response_cache.get(cache_key)
+            score, similar = None, None
+            if cached is None and not fresh_requested and st.session_state.get("reuse_similar", True):
+                score, similar = find_similar(all_ingredients, constraint)
+            
+            if cached is not None or similar:
+                recipes = parse_recipes(cached) if cached is not None else similar
+                st.session_state.results["generate"] = {
+                    "heading": heading,
+                    "caption": "⚡ Served from cache" if cached is not None else f"♻️ Reused recipes from a similar fridge ({score:.0%} ingredient match)",
+                    "notes": [],
+                    "similar": cached is None,
                     "ingredients": ingredient_str,
-                    "recipes": [{"title": "Recipe"}],  # Simplified for now
-                    "response": response.text
-                })
-                
-                st.markdown("## 📖 Your AI-Powered Recipes:")
-                
-                # Split recipes for individual display and save options
-                recipes = response.text.split("---")
+                    "recipes": recipes
+                }
+                store.add_history(user_id, ingredient_str, recipes, cuisine=cuisine, diet=diet)
+                library_index.add(user_id, recipes)
+            else:
+                parallel = generation_mode == "Parallel" and recipe_count > 1
+                prompt = build_prompt(ingredient_str, avoided_ingredient_str, cuisine, meal_type, diet, 1 if parallel else recipe_count, st.session_state.user_profile, advanced_options, structured=structured_output, compact=profile["compact"])
+                repair_prompt = build_prompt(ingredient_str, avoided_ingredient_str, cuisine, meal_type, diet, 1, st.session_state.user_profile, advanced_options, structured=structured_output, compact=profile["compact"])
+                model = routed_model(recipe_count)
+                # Fan-out requests ask for one recipe each, so each gets a one-recipe token budget
+                generation_config = recipe_generation_config(structured_output, profile, 1 if parallel else recipe_count)
                 
-                for i, recipe in enumerate(recipes):
-                    with st.container():
-                        st.markdown('<div class="recipe-card">', unsafe_allow_html=True)
-                        
-                        col1, col2 = st.columns([5, 1])
-                        
-                        with col1:
-                            st.markdown(recipe)
-                        
-                        with col2:
-                            # Extract title from recipe
-                            recipe_title = recipe.split('\n')[0].replace('#', '').strip() if recipe else f"Recipe {i+1}"
-                            
-                            # Save button
-                            if st.button("⭐ Save", key=f"save_{i}"):
-                                st.session_state.favorites.append({
-                                    "title": recipe_title,
-                                    "content": recipe,
-                                    "ingredients": ingredient_str,
-                                    "date_saved": datetime.now().strftime("%Y-%m-%d")
-                                })
-                                st.success(f"Saved {recipe_title}!")
-                            
-                            # Share button (placeholder)
-                            if st.button("📤 Share", key=f"share_{i}"):
-                                st.info("Sharing will be available soon!")
-                                
-                            # Print button
-                            if st.button("🖨️ Print", key=f"print_{i}"):
-                                st.info("Print-friendly version coming soon!")
-                        
-                        st.markdown('</div>', unsafe_allow_html=True)
+                if parallel:
+                    run = generation_job(fan_out_into, model, prompt, recipe_count, generation_config, PARALLEL_TIMEOUT, friendly_error, cache_key=cache_key, similar_key=(all_ingredients, constraint), repair_prompt=repair_prompt)
+                elif generation_mode == "Streaming":
+                    run = generation_job(stream_into, model, prompt, structured_output, generation_config, cache_key=cache_key, similar_key=(all_ingredients, constraint), repair_prompt=repair_prompt)
+                else:
+                    run = generation_job(generate_into, model, prompt, generation_config, cache_key=cache_key, similar_key=(all_ingredients, constraint), repair_prompt=repair_prompt)
                 
-            except Exception as e:
-                st.error(f"Something went wrong: {e}")
+                # Identical in-flight requests from any session share one job
+                start_job("generate", run, heading, ingredient_str, key=cache_key)
+            
+        except Exception as e:
+            st.error(friendly_error(e))
 
     # Random recipe generation
     elif surprise_button and api_key:
@@ -387,74 +748,69 @@ If specified, avoid using these ingredients: {avoid_ingredients}.
         random_cuisine = random.choice(["Any"] + st.session_state.user_profile.get("preferred_cuisines", []))
         random_meal = random.choice(["Main course", "Side dish", "Dessert", "Breakfast"])
         
-        st.info(f"Surprising you with: {random_ingredient_str} ({random_cuisine}, {random_meal})")
+        caption = f"Surprising you with: {random_ingredient_str} ({random_cuisine}, {random_meal})"
+        heading = "## 🎉 Your Surprise Recipe:"
         
-        prompt = build_prompt(random_ingredient_str, avoided_ingredient_str, random_cuisine, random_meal, diet, 1, st.session_state.user_profile)
+        prompt = build_prompt(random_ingredient_str, avoided_ingredient_str, random_cuisine, random_meal, diet, 1, st.session_state.user_profile, structured=structured_output, compact=profile["compact"])
+        model = routed_model(1, surprise=True)
+        generation_config = recipe_generation_config(structured_output, profile, 1)
         
-        with st.spinner("Creating a surprising recipe with Gemini..."):
-            try:
-                response = model.generate_content(prompt)
-                
-                st.markdown("## 🎉 Your Surprise Recipe:")
-                
-                with st.container():
-                    st.markdown('<div class="recipe-card">', unsafe_allow_html=True)
-                    
-                    col1, col2 = st.columns([5, 1])
-                    
-                    with col1:
-                        st.markdown(response.text)
-                    
-                    with col2:
-                        # Extract title
-                        recipe_title = response.text.split('\n')[0].replace('#', '').strip() if response.text else "Surprise Recipe"
-                        
-                        # Save button
-                        if st.button("⭐ Save", key="save_surprise"):
-                            st.session_state.favorites.append({
-                                "title": recipe_title,
-                                "content": response.text,
-                                "ingredients": random_ingredient_str,
-                                "date_saved": datetime.now().strftime("%Y-%m-%d")
-                            })
-                            st.success(f"Saved {recipe_title}!")
-                    
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-            except Exception as e:
-                st.error(f"Something went wrong: {e}")
+        if generation_mode == "Streaming":
+            run = generation_job(stream_into, model, prompt, structured_output, generation_config, repair_prompt=prompt)
+        else:
+            run = generation_job(generate_into, model, prompt, generation_config, repair_prompt=prompt)
+        start_job("surprise", run, heading, random_ingredient_str, caption=caption, key_prefix="surprise_")
 
     elif not api_key:
         st.warning("Please enter your Gemini API key in the sidebar.")
     elif not ingredient_str and (generate_button or surprise_button):
         st.info("Add some ingredients to start generating recipes!")
 
+    # Results from earlier runs survive Save/Share/Print reruns
+    active_job = st.session_state.get("active_job")
+    if active_job:
+        show_active_job()
+    if not active_job or active_job["kind"] != "generate":
+        render_results("generate")
+    if not active_job or active_job["kind"] != "surprise":
+        render_results("surprise", key_prefix="surprise_")
+    
+    if st.session_state.results and st.button("🧹 Clear results", disabled=active_job is not None):
+        st.session_state.results = {}
+        st.rerun()
+
 # --- Recipe Browser Tab ---
 with tab2:
     st.header("📱 Recipe Browser")
     
-    if not st.session_state.favorites:
+    if not store.count_favorites(user_id):
         st.info("You haven't saved any recipes yet. Generate and save recipes to see them here!")
     else:
         # Filter options
-        filter_col1, filter_col2 = st.columns(2)
+        filter_col1, filter_col2, filter_col3 = st.columns([2, 1, 1])
         with filter_col1:
-            search_term = st.text_input("🔍 Search saved recipes", "")
+            search_term = st.text_input("🔍 Search saved recipes", "", help="Searches titles, ingredients and recipe text. Partial words match too.")
         with filter_col2:
-            sort_by = st.selectbox("Sort by:", ["Latest", "Oldest", "A-Z"])
+            sort_options = ["Latest", "Oldest", "A-Z"]
+            if search_term:
+                sort_options = ["Relevance"] + sort_options
+            sort_by = st.selectbox("Sort by:", sort_options)
+        with filter_col3:
+            page_size = st.selectbox("Per page:", BROWSER_PAGE_SIZES)
         
-        # Apply filters and sorting
-        filtered_recipes = st.session_state.favorites
+        # Start from the first page whenever the query changes
+        browser_query = (search_term, sort_by, page_size)
+        if st.session_state.get("browser_query") != browser_query:
+            st.session_state.browser_query = browser_query
+            st.session_state.browser_page = 1
         
-        if search_term:
-            filtered_recipes = [r for r in filtered_recipes if search_term.lower() in r['title'].lower() or search_term.lower() in r.get('ingredients', '').lower()]
+        # Filtering, sorting and paging run in the database; only the visible page is loaded
+        match_count = store.count_favorites(user_id, search=search_term)
+        offset = page_controls("browser_page", match_count, page_size)
+        filtered_recipes = store.list_favorites(user_id, search=search_term, order=sort_by, limit=page_size, offset=offset)
         
-        if sort_by == "Latest":
-            filtered_recipes = sorted(filtered_recipes, key=lambda x: x.get('date_saved', ''), reverse=True)
-        elif sort_by == "Oldest":
-            filtered_recipes = sorted(filtered_recipes, key=lambda x: x.get('date_saved', ''))
-        elif sort_by == "A-Z":
-            filtered_recipes = sorted(filtered_recipes, key=lambda x: x['title'])
+        if match_count:
+            st.caption(f"Showing {offset + 1}–{offset + len(filtered_recipes)} of {match_count} recipes")
         
         # Display recipes in grid
         if filtered_recipes:
@@ -466,27 +822,76 @@ with tab2:
                         <h3>{recipe['title']}</h3>
                         <p><small>Saved on: {recipe.get('date_saved', 'Unknown')}</small></p>
                         <p><small>Ingredients: {recipe.get('ingredients', 'Various')[:50]}...</small></p>
+                        {f'<p><small>{recipe["snippet"]}</small></p>' if recipe.get('snippet') else ''}
                     </div>
                     """, unsafe_allow_html=True)
                     
+                    st.checkbox(
+                        "📖 Add to cookbook",
+                        value=recipe['id'] in st.session_state.cookbook_ids,
+                        key=f"cookbook_{recipe['id']}",
+                        on_change=toggle_cookbook,
+                        args=(recipe['id'],)
+                    )
+                    
                     col1, col2 = st.columns(2)
                     with col1:
-                        if st.button("View", key=f"view_{i}"):
-                            st.session_state.selected_recipe = recipe
+                        if st.button("View", key=f"view_{recipe['id']}"):
+                            st.session_state.selected_recipe = recipe['id']
                             st.rerun()
                     with col2:
-                        if st.button("Delete", key=f"delete_browse_{i}"):
-                            st.session_state.favorites.remove(recipe)
+                        if st.button("Delete", key=f"delete_browse_{recipe['id']}"):
+                            store.delete_favorite(user_id, recipe['id'])
+                            st.session_state.cookbook_ids.discard(recipe['id'])
+                            library_index.reset(user_id)
                             st.rerun()
         else:
             st.warning("No recipes match your search criteria.")
+        
+        # Cookbook export
+        with st.expander("📖 Cookbook PDF"):
+            st.write("Print your favorites as one PDF with a table of contents, sorted A-Z")
+            selected_count = len(st.session_state.cookbook_ids)
+            cookbook_scope = st.radio("Include", ["Selected recipes", "Whole library"], horizontal=True, help="Tick \"Add to cookbook\" on any recipe card to select it.")
+            st.caption(f"{selected_count} recipes selected")
+            cookbook_title = st.text_input("Cookbook title", "My Cookbook")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                build_cookbook = st.button("Build Cookbook", use_container_width=True, disabled=cookbook_scope == "Selected recipes" and not selected_count)
+            with col2:
+                if st.button("Clear Selection", use_container_width=True, disabled=not selected_count):
+                    st.session_state.cookbook_ids = set()
+                    st.rerun()
+            
+            if build_cookbook:
+                # Only titles are loaded up front; bodies are read one by one while laying out
+                cookbook_ids = [
+                    favorite["id"]
+                    for favorite in sorted(store.iter_favorites(user_id), key=lambda f: f["title"].lower())
+                    if cookbook_scope == "Whole library" or favorite["id"] in st.session_state.cookbook_ids
+                ]
+                with st.spinner(f"Laying out {len(cookbook_ids)} recipes..."), tempfile.TemporaryFile() as cookbook_file:
+                    page_count = cookbook.write_cookbook(filter(None, map(store.get_recipe, cookbook_ids)), cookbook_file, cookbook_title)
+                    cookbook_file.seek(0)
+                    st.download_button(
+                        "📥 Download cookbook",
+                        cookbook_file.read(),
+                        "fridgefeast_cookbook.pdf",
+                        "application/pdf",
+                        key='download-cookbook'
+                    )
+                st.caption(f"{len(cookbook_ids)} recipes, {page_count} pages")
     
     # Recipe detail view
     if 'selected_recipe' in st.session_state and st.session_state.selected_recipe:
-        recipe = st.session_state.selected_recipe
-        
+        recipe = store.get_favorite(user_id, st.session_state.selected_recipe)
+    else:
+        recipe = None
+    
+    if recipe:
         with st.expander("Recipe Details", expanded=True):
-            st.markdown(recipe['content'])
+            st.markdown(to_markdown(recipe['recipe']))
             
             col1, col2, col3 = st.columns([1,1,1])
             with col1:
@@ -494,8 +899,13 @@ with tab2:
                     del st.session_state.selected_recipe
                     st.rerun()
             with col2:
-                if st.button("🖨️ Print Recipe"):
-                    st.info("Print functionality coming soon!")
+                st.download_button(
+                    "🖨️ Print Recipe",
+                    cookbook.recipe_pdf(recipe['recipe']),
+                    f"{recipe['title']}.pdf",
+                    "application/pdf",
+                    key=f"print_detail_{recipe['id']}"
+                )
             with col3:
                 if st.button("📤 Share Recipe"):
                     st.info("Sharing functionality coming soon!")
@@ -509,24 +919,25 @@ with tab3:
     # Data management
     with st.expander("Data Management"):
         st.write("Manage your saved recipes and application data")
+        body_stats = store.body_stats()
+        st.caption(f"{body_stats['bodies']} unique recipes stored ({body_stats['bytes'] / 1024:.1f} KB compressed)")
         
         col1, col2 = st.columns(2)
         with col1:
+            compress_export = st.checkbox("Compress export (gzip)", value=True)
             if st.button("Export All Data", use_container_width=True):
-                export_data = {
-                    "favorites": st.session_state.favorites,
-                    "recipe_history": st.session_state.recipe_history,
-                    "user_profile": st.session_state.user_profile
-                }
-                
-                export_json = json.dumps(export_data)
-                st.download_button(
-                    "📥 Download JSON",
-                    export_json,
-                    "fridgefeast_data.json",
-                    "application/json",
-                    key='download-json'
-                )
+                # Streamed record by record to disk; only the finished file is read back for the download
+                with tempfile.TemporaryFile() as export_file:
+                    for chunk in export_archive(store, user_id, st.session_state.user_profile, compress=compress_export):
+                        export_file.write(chunk)
+                    export_file.seek(0)
+                    st.download_button(
+                        "📥 Download archive",
+                        export_file.read(),
+                        "fridgefeast_data.ndjson.gz" if compress_export else "fridgefeast_data.ndjson",
+                        "application/gzip" if compress_export else "application/x-ndjson",
+                        key='download-archive'
+                    )
         
         with col2:
             if st.button("Clear All Data", use_container_width=True):
@@ -534,30 +945,117 @@ with tab3:
                 confirm = st.checkbox("I understand, clear my data")
                 
                 if confirm and st.button("Confirm Clear Data"):
-                    st.session_state.favorites = []
-                    st.session_state.recipe_history = []
+                    store.clear(user_id)
+                    library_index.reset(user_id, [])
+                    st.session_state.cookbook_ids = set()
                     st.success("All data cleared!")
     
+    # Response cache
+    with st.expander("Response Cache"):
+        st.write("Identical requests are served from a local cache instead of calling Gemini again")
+        cache_stats = response_cache.stats()
+        
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Hits", cache_stats["hits"])
+        col2.metric("Misses", cache_stats["misses"])
+        col3.metric("Hit rate", f"{cache_stats['hit_rate']:.0%}")
+        col4.metric("Entries", cache_stats["entries"])
+        st.caption(f"Cache size: {cache_stats['bytes'] / 1024:.1f} KB")
+        
+        st.caption(f"Similar-fridge index: {similarity_index.count()} generations")
+        
+        st.checkbox("♻️ Reuse recipes from similar fridges", value=True, key="reuse_similar", help="Serves earlier recipes when your ingredients nearly match a previous request with the same cuisine, meal type, diet and avoid list.")
+        st.slider("Similarity threshold", 0.5, 1.0, DEFAULT_THRESHOLD, 0.05, key="similarity_threshold", help="Share of ingredients two fridges must have in common (Jaccard similarity).")
+        
+        if st.button("Clear Response Cache"):
+            response_cache.clear()
+            similarity_index.clear()
+            st.success("Response cache cleared!")
+    
     # Import functionality
     with st.expander("Import Data"):
-        st.write("Import previously exported data")
-        uploaded_file = st.file_uploader("Upload JSON data file", type=['json'])
+        st.write("Import previously exported data. Recipes you already have are kept, not duplicated.")
+        uploaded_file = st.file_uploader("Upload an export", type=['ndjson', 'jsonl', 'gz', 'json'])
         
-        if uploaded_file is not None:
+        if uploaded_file is not None and st.button("Import Data"):
+            progress_bar = st.progress(0.0, text="Importing...")
             try:
-                import_data = json.loads(uploaded_file.getvalue().decode("utf-8"))
+                summary = import_archive(store, user_id, uploaded_file, progress=lambda done: progress_bar.progress(done, text="Importing..."))
+                # Imports only add to the library, so the matcher is extended rather than rebuilt;
+                # recipes it already holds are skipped, and ids stream from storage one at a time
+                if summary["favorites"] or summary["history"]:
+                    library_index.add(user_id, filter(None, map(store.get_recipe, store.iter_user_recipe_ids(user_id))))
+                if summary["profile"] is not None:
+                    st.session_state.user_profile = clean_profile(summary["profile"])
                 
-                if st.button("Import Data"):
-                    if "favorites" in import_data:
-                        st.session_state.favorites = import_data["favorites"]
-                    if "recipe_history" in import_data:
-                        st.session_state.recipe_history = import_data["recipe_history"]
-                    if "user_profile" in import_data:
-                        st.session_state.user_profile = import_data["user_profile"]
-                    
-                    st.success("Data imported successfully!")
+                st.success(f"Imported {summary['favorites']} favorites and {summary['history']} history entries ({summary['duplicates']} already saved).")
+                if summary["invalid"]:
+                    st.warning(f"Skipped {summary['invalid']} invalid records:\n\n" + "\n\n".join(summary["errors"]))
             except Exception as e:
                 st.error(f"Error importing data: {e}")
+            finally:
+                progress_bar.empty()
+    
+    # Diagnostics
+    with st.expander("Diagnostics"):
+        st.write("Latency of the hot paths in this server process (most recent observations per series)")
+        snapshot = METRICS.snapshot()
+        
+        latency_rows = [
+            {
+                "Phase": name.removesuffix("_seconds"),
+                "Labels": ", ".join(f"{k}={v}" for k, v in series["labels"].items()),
+                "Count": series["count"],
+                "p50 (ms)": round(series["p50"] * 1000, 2),
+                "p95 (ms)": round(series["p95"] * 1000, 2),
+                "p99 (ms)": round(series["p99"] * 1000, 2),
+            }
+            for name, all_series in sorted(snapshot["histograms"].items())
+            for series in all_series
+            if series["count"]
+        ]
+        if latency_rows:
+            st.dataframe(pd.DataFrame(latency_rows), hide_index=True, use_container_width=True)
+        else:
+            st.info("No timings recorded yet.")
+        
+        def totals(name, label):
+            # Sum over the other labels, e.g. the per-model series of one token kind
+            counts = {}
+            for c in snapshot["counters"].get(name, []):
+                key = c["labels"].get(label)
+                counts[key] = counts.get(key, 0) + c["value"]
+            return counts
+        
+        tokens = totals("gemini_tokens_total", "kind")
+        lookups = totals("response_cache_lookups_total", "result")
+        similar = totals("similar_fridge_lookups_total", "result")
+        
+        def hit_rate(counts):
+            total = counts.get("hit", 0) + counts.get("miss", 0)
+            return f"{counts.get('hit', 0) / total:.0%}" if total else "–"
+        
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Prompt tokens", tokens.get("prompt", 0))
+        col2.metric("Output tokens", tokens.get("output", 0))
+        col3.metric("Cache hit rate", hit_rate(lookups))
+        col4.metric("Similar-fridge hit rate", hit_rate(similar))
+        
+        errors = snapshot["counters"].get("gemini_errors_total", [])
+        if errors:
+            st.caption("Gemini errors: " + ", ".join(f"{e['labels']['type']} × {e['value']}" for e in errors))
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.download_button("📈 Prometheus", METRICS.to_prometheus(), "fridgefeast_metrics.prom", "text/plain", use_container_width=True)
+        with col2:
+            st.download_button("🧾 JSON", METRICS.to_json(), "fridgefeast_metrics.json", "application/json", use_container_width=True)
+        with col3:
+            if st.button("Reset Metrics", use_container_width=True):
+                METRICS.reset()
+                st.rerun()
+        if os.environ.get("FRIDGEFEAST_METRICS_PORT"):
+            st.caption(f"Prometheus endpoint: :{os.environ['FRIDGEFEAST_METRICS_PORT']}/metrics")
     
     # App information
     st.subheader("About FridgeFeast")
@@ -577,3 +1075,5 @@ st.markdown("""
     <p>© 2025 FridgeFeast | Made with  Streamlit  + ❤️  | Powered by Gemini ✨</p>
 </div>
 """, unsafe_allow_html=True)
+
+observe("script_rerun_seconds", time.perf_counter() - rerun_started)
@@ -0,0 +1,244 @@
+"""Streaming export and import of a user's data as NDJSON.
+
+An archive holds one JSON record per line, optionally gzip-compressed:
+
+    {"type": "header", "format": "fridgefeast", "version": 1, "exported_at": "..."}
+    {"type": "profile", "data": {...}}
+    {"type": "recipe", "id": "<content hash>", "data": {...}}
+    {"type": "favorite", "id": "<recipe id>", "ingredients": "...", "date_saved": "..."}
+    {"type": "history", "date": "...", "ingredients": "...", "recipe_ids": ["..."],
+     "cuisine": "...", "diet": "...", "latency": 4.2}
+
+Every recipe body is written once, before the favorites and history entries
+that refer to it.  Export is a generator of byte chunks and import reads
+record by record, writing bodies straight to storage, so neither side holds
+more than one record in memory.  Imports merge into existing data: saved
+favorites and identical history entries are skipped rather than replaced.
+Single-document JSON exports from older versions are still accepted.
+"""
+
+import gzip
+import io
+import json
+import zlib
+from datetime import datetime
+
+from recipes import Recipe, favorite_from_dict, favorite_to_dict, history_from_dict, history_to_dict
+
+
+ARCHIVE_FORMAT = "fridgefeast"
+ARCHIVE_VERSION = 1
+CHUNK_SIZE = 1 << 16
+# Progress is reported every this many records
+PROGRESS_EVERY = 500
+# Only the first few invalid records are described in the import summary
+MAX_REPORTED_ERRORS = 10
+
+_OPTIONAL_TEXT = (str, type(None))
+RECORD_FIELDS = {
+    "header": {"format": str, "version": int},
+    "profile": {"data": dict},
+    "recipe": {"id": str, "data": dict},
+    "favorite": {"id": str, "ingredients": _OPTIONAL_TEXT, "date_saved": _OPTIONAL_TEXT},
+    "history": {"date": _OPTIONAL_TEXT, "ingredients": _OPTIONAL_TEXT, "recipe_ids": list},
+}
+# Fields added in later versions; archives written before them still validate
+OPTIONAL_FIELDS = {
+    "history": {"cuisine": _OPTIONAL_TEXT, "diet": _OPTIONAL_TEXT, "latency": (int, float, type(None))},
+}
+
+
+# --- Export ---
+def export_records(store, user_id, user_profile):
+    yield {"type": "header", "format": ARCHIVE_FORMAT, "version": ARCHIVE_VERSION,
+           "exported_at": datetime.now().isoformat(timespec="seconds")}
+    yield {"type": "profile", "data": user_profile}
+    for recipe_id in store.iter_user_recipe_ids(user_id):
+        yield {"type": "recipe", "id": recipe_id, "data": store.get_recipe(recipe_id).to_dict()}
+    for favorite in store.iter_favorites(user_id):
+        yield {"type": "favorite", **favorite_to_dict(favorite)}
+    for entry in store.iter_history(user_id):
+        yield {"type": "history", **history_to_dict(entry, store.history_recipe_ids(entry["id"]))}
+
+
+def export_archive(store, user_id, user_profile, compress=False, chunk_size=CHUNK_SIZE):
+    """Yield the archive as byte chunks of roughly ``chunk_size``, gzipped if ``compress``."""
+    # wbits=31 writes a gzip container, so the output opens with any gunzip
+    encoder = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending, size = [], 0
+    for record in export_records(store, user_id, user_profile):
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        pending.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            chunk = b"".join(pending)
+            pending, size = [], 0
+            chunk = encoder.compress(chunk) if encoder else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(pending)
+    if encoder:
+        chunk = encoder.compress(chunk) + encoder.flush()
+    if chunk:
+        yield chunk
+
+
+# --- Import ---
+def validate_record(record):
+    """Raise ``ValueError`` unless ``record`` is a well-formed archive record."""
+    if not isinstance(record, dict):
+        raise ValueError("Record must be a JSON object")
+    kind = record.get("type")
+    fields = RECORD_FIELDS.get(kind)
+    if fields is None:
+        raise ValueError(f"Unknown record type: {kind!r}")
+    for name, types in fields.items():
+        if not isinstance(record.get(name), types):
+            raise ValueError(f"{kind} record has an invalid or missing {name!r}")
+    for name, types in OPTIONAL_FIELDS.get(kind, {}).items():
+        if name in record and not isinstance(record[name], types):
+            raise ValueError(f"{kind} record has an invalid {name!r}")
+    if kind == "history" and not all(isinstance(i, str) for i in record["recipe_ids"]):
+        raise ValueError("history record has a non-string recipe id")
+    if kind == "header" and (record["format"] != ARCHIVE_FORMAT or record["version"] > ARCHIVE_VERSION):
+        raise ValueError(f"Unsupported archive: {record['format']} version {record['version']}")
+
+
+def legacy_records(data):
+    """Archive records for a single-document JSON export from an older version.
+
+    An entry that can't be converted yields a ``ValueError`` in place of its
+    records, like an unparseable NDJSON line.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Export must be a JSON object")
+    if "user_profile" in data:
+        yield {"type": "profile", "data": data["user_profile"]}
+    recipes = data.get("recipes")
+    for n, item in enumerate(data.get("favorites") or [], 1):
+        try:
+            favorite = favorite_from_dict(item, recipes)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            yield ValueError(f"favorite {n} could not be read ({type(e).__name__}: {e})")
+            continue
+        yield {"type": "recipe", "id": favorite["recipe"].id, "data": favorite["recipe"].to_dict()}
+        yield {"type": "favorite", "id": favorite["recipe"].id, "ingredients": favorite["ingredients"], "date_saved": favorite["date_saved"]}
+    for n, item in enumerate(data.get("recipe_history") or [], 1):
+        try:
+            entry = history_from_dict(item, recipes)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            yield ValueError(f"history entry {n} could not be read ({type(e).__name__}: {e})")
+            continue
+        for recipe in entry["recipes"]:
+            yield {"type": "recipe", "id": recipe.id, "data": recipe.to_dict()}
+        yield {"type": "history", "date": entry["date"], "ingredients": entry["ingredients"], "recipe_ids": [r.id for r in entry["recipes"]],
+               "cuisine": entry["cuisine"], "diet": entry["diet"], "latency": entry["latency"]}
+
+
+def _open_text(fileobj):
+    head = fileobj.read(2)
+    fileobj.seek(0)
+    if head == b"\x1f\x8b":
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode="rb")
+    return io.TextIOWrapper(fileobj, encoding="utf-8")
+
+
+def read_records(fileobj):
+    """Yield ``(line, record)`` from an NDJSON archive (gzipped or not) or a legacy JSON export.
+
+    Unparseable lines and unreadable legacy entries yield a ``ValueError``
+    as the record, so one bad record is reported instead of aborting the
+    import.
+    """
+    text = _open_text(fileobj)
+    try:
+        first = text.readline()
+        try:
+            head = json.loads(first)
+        except ValueError:
+            head = None
+        if not (isinstance(head, dict) and "type" in head):
+            # Older exports are one JSON document, possibly spread over several lines
+            data = head if head is not None else json.loads(first + text.read())
+            for record in legacy_records(data):
+                yield 1, record
+            return
+
+        yield 1, head
+        for line, raw in enumerate(text, 2):
+            if not raw.strip():
+                continue
+            try:
+                yield line, json.loads(raw)
+            except ValueError as e:
+                yield line, ValueError(f"Invalid JSON: {e}")
+    finally:
+        # Leave the caller's file open
+        text.detach()
+
+
+def import_archive(store, user_id, fileobj, progress=None):
+    """Merge an archive into ``user_id``'s data in one transaction and return a summary.
+
+    ``fileobj`` must be a seekable binary file.  ``progress`` is called with
+    the fraction of the file read so far.  Invalid records are skipped and
+    counted; any other error rolls the whole import back.
+    """
+    total = fileobj.seek(0, io.SEEK_END)
+    fileobj.seek(0)
+    summary = {
+        "recipes": 0, "favorites": 0, "history": 0, "duplicates": 0,
+        "invalid": 0, "errors": [], "profile": None,
+    }
+    # Bodies whose content no longer matches their id were stored under the new id
+    renamed = {}
+
+    def resolve(recipe_id):
+        recipe_id = renamed.get(recipe_id, recipe_id)
+        if not store.has_recipe(recipe_id):
+            raise ValueError(f"refers to recipe {recipe_id!r}, which the archive doesn't contain")
+        return recipe_id
+
+    with store.transaction():
+        for n, (line, record) in enumerate(read_records(fileobj), 1):
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                validate_record(record)
+                kind = record["type"]
+                if kind == "profile":
+                    summary["profile"] = record["data"]
+                elif kind == "recipe":
+                    recipe = Recipe.from_dict(record["data"])
+                    if recipe.id != record["id"]:
+                        renamed[record["id"]] = recipe.id
+                    store.put_recipe(recipe)
+                    summary["recipes"] += 1
+                elif kind == "favorite":
+                    recipe = store.get_recipe(resolve(record["id"]))
+                    added = store.add_favorite(user_id, recipe, record["ingredients"] or "", record["date_saved"] or None)
+                    summary["favorites" if added else "duplicates"] += 1
+                elif kind == "history":
+                    recipe_ids = [resolve(i) for i in record["recipe_ids"]]
+                    date, ingredients = record["date"] or None, record["ingredients"] or ""
+                    if date and store.has_history(user_id, date, ingredients, recipe_ids):
+                        summary["duplicates"] += 1
+                    else:
+                        store.add_history(
+                            user_id, ingredients, [store.get_recipe(i) for i in recipe_ids], date,
+                            record.get("cuisine") or "", record.get("diet") or "", record.get("latency"),
+                        )
+                        summary["history"] += 1
+            except ValueError as e:
+                # Nothing after a header we don't understand can be trusted
+                if isinstance(record, dict) and record.get("type") == "header":
+                    raise
+                summary["invalid"] += 1
+                if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                    summary["errors"].append(f"Line {line}: {e}")
+            if progress and n % PROGRESS_EVERY == 0:
+                progress(min(1.0, fileobj.tell() / total) if total else 1.0)
+        store.prune_bodies()
+    if progress:
+        progress(1.0)
+    return summary
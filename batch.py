@@ -0,0 +1,323 @@
+"""Headless batch generation.
+
+    python batch.py stores.csv -o recipes.jsonl --concurrency 8
+
+Reads ingredient sets and preferences from CSV or JSONL, generates recipes
+for each through the shared rate-limited Gemini client with bounded
+concurrency, and appends one JSON line per request to the output.  The
+output doubles as the checkpoint: rerunning the same command skips every
+request that already succeeded and retries the ones recorded as errors.
+
+Results also land in the response cache and similar-fridge index, so the
+app serves pre-generated catalogs without calling Gemini.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from allergens import validator_for
+from cache import ResponseCache, make_cache_key
+from gemini_client import friendly_error, get_client, route_model
+from generation import DEFAULT_PROFILE, PROFILES, build_prompt, generate_recipes, profile_cache_id, recipe_generation_config
+from ingredients import canonical_ingredients
+from recipes import dump_recipes, parse_recipes
+from similarity import SimilarityIndex, constraint_key
+
+
+# Same defaults as the app's Advanced Options, so batch results hit its cache
+ADVANCED_DEFAULTS = {"cooking_time": "Any", "spice_level": 2, "skill_required": "Any", "calories": "Any"}
+
+
+def _items(value, field):
+    if isinstance(value, str):
+        return [i.strip() for i in value.split(",") if i.strip()]
+    if value is not None and not isinstance(value, list):
+        raise ValueError(f"{field} must be a list or a comma-separated string")
+    return [str(i).strip() for i in value or [] if str(i).strip()]
+
+
+def _choice(data, field, default):
+    value = data.get(field)
+    if value in (None, ""):
+        return default
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string")
+    return value
+
+
+def _flag(value, default):
+    if value in (None, ""):
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def read_requests(path):
+    """Yield ``(line, data)`` pairs from a .csv or .jsonl file (``-`` reads JSONL from stdin).
+
+    Unreadable JSONL lines yield a ``ValueError`` as ``data`` so they are
+    recorded as errors instead of stopping the run.
+    """
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            for line, row in enumerate(csv.DictReader(f), 2):
+                yield line, row
+        return
+
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except ValueError as e:
+                yield line, ValueError(f"Invalid JSON: {e}")
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def normalize_request(data, structured=True):
+    """Validate one input row into the arguments of :func:`generation.build_prompt`."""
+    if not isinstance(data, dict):
+        raise ValueError("Request must be a JSON object")
+    # Folded to the app's canonical names ("Tomatoes" -> "Tomato") so both build the same cache key
+    ingredients = canonical_ingredients(_items(data.get("ingredients"), "ingredients"))
+    if not ingredients:
+        raise ValueError("Request has no ingredients")
+    try:
+        count = int(data.get("count") or 3)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid count: {data.get('count')!r}")
+    if not 1 <= count <= 10:
+        raise ValueError("count must be between 1 and 10")
+
+    if not isinstance(data.get("advanced") or {}, dict):
+        raise ValueError("advanced must be a JSON object")
+    advanced = {**ADVANCED_DEFAULTS, **(data.get("advanced") or {})}
+    for field in ADVANCED_DEFAULTS:
+        if data.get(field) not in (None, ""):
+            advanced[field] = data[field]
+    for field in ("cooking_time", "skill_required", "calories"):
+        if not isinstance(advanced[field], str):
+            raise ValueError(f"{field} must be a string")
+    try:
+        advanced["spice_level"] = int(advanced["spice_level"])
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid spice_level: {advanced['spice_level']!r}")
+    if not 1 <= advanced["spice_level"] <= 5:
+        raise ValueError("spice_level must be between 1 and 5")
+
+    return {
+        "ingredients": ingredients,
+        "avoid": _items(data.get("avoid"), "avoid"),
+        "cuisine": _choice(data, "cuisine", "Any"),
+        "meal_type": _choice(data, "meal_type", "Any"),
+        "diet": _choice(data, "diet", "None"),
+        "count": count,
+        "user_profile": {
+            "preferred_cuisines": _items(data.get("preferred_cuisines"), "preferred_cuisines"),
+            "skill_level": _choice(data, "skill_level", "Beginner"),
+        },
+        "advanced": advanced,
+        "structured": _flag(data.get("structured"), structured),
+    }
+
+
+def request_key(request, model_name):
+    return make_cache_key(
+        request["ingredients"], request["avoid"], request["cuisine"], request["meal_type"], request["diet"],
+        request["count"], request["user_profile"], request["advanced"], model_name, structured=request["structured"],
+    )
+
+
+def load_checkpoint(path):
+    """Ids already written with ``status: ok``; a torn last line is ignored."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for text in f:
+            try:
+                record = json.loads(text)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+class BatchRunner:
+    """Runs requests under one generation profile.
+
+    ``model_for(count)`` returns the client for a request of ``count``
+    recipes; ``model_name`` is the model identity used in cache keys.
+    """
+
+    def __init__(self, model_for, model_name, mode="single", timeout=45, cache=None, index=None, profile=None):
+        self.model_for = model_for
+        self.model_name = model_name
+        self.profile = profile or PROFILES[DEFAULT_PROFILE]
+        self.mode = mode
+        self.timeout = timeout
+        self.cache = cache
+        self.index = index
+
+    def run(self, item_id, request, cache_key):
+        """Generate one request and return its output record; never raises."""
+        started = time.perf_counter()
+        record = {"id": item_id, "request": request}
+        try:
+            cached = self.cache.get(cache_key) if self.cache else None
+            if cached is not None:
+                recipes, notes, source = parse_recipes(cached), [], "cache"
+            else:
+                recipes, notes = self._generate(request)
+                source = "gemini"
+                if self.cache and recipes and not notes:
+                    self.cache.put(cache_key, dump_recipes(recipes), self.model_name)
+                    if self.index:
+                        self.index.add(cache_key, request["ingredients"], self._constraint(request))
+            if not recipes:
+                raise ValueError("The response contained no recipes")
+            record.update(status="ok", source=source, recipes=[r.to_dict() for r in recipes], notes=notes)
+        except Exception as e:
+            record.update(status="error", error=friendly_error(e), error_type=type(e).__name__)
+        record["elapsed"] = round(time.perf_counter() - started, 3)
+        return record
+
+    def _generate(self, request):
+        parallel = self.mode == "parallel" and request["count"] > 1
+
+        def prompt_for(count):
+            return build_prompt(
+                ", ".join(request["ingredients"]), ", ".join(request["avoid"]), request["cuisine"], request["meal_type"],
+                request["diet"], count, request["user_profile"], request["advanced"], structured=request["structured"],
+                compact=self.profile["compact"],
+            )
+
+        # Fan-out and repair calls ask for one recipe each, so that is their token budget
+        return generate_recipes(
+            self.model_for(request["count"]), prompt_for(1 if parallel else request["count"]), request["count"], request["structured"],
+            self.mode, recipe_generation_config(request["structured"], self.profile, 1 if parallel else request["count"]),
+            self.timeout, friendly_error, validator=validator_for(request["avoid"]), repair_prompt=prompt_for(1),
+        )
+
+    def _constraint(self, request):
+        return constraint_key(
+            request["avoid"], request["cuisine"], request["meal_type"], request["diet"], request["count"],
+            request["user_profile"], request["advanced"], self.model_name, structured=request["structured"],
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate recipes for a file of ingredient sets.")
+    parser.add_argument("input", help="CSV or JSONL file of requests ('-' for JSONL on stdin)")
+    parser.add_argument("-o", "--output", required=True, help="JSONL results file, also used as the resume checkpoint")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY"))
+    parser.add_argument("--profile", choices=list(PROFILES), default=DEFAULT_PROFILE, help="generation profile (model, token budget, prompt)")
+    parser.add_argument("--model", help="always use this model instead of routing by profile")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests generated at once")
+    parser.add_argument("--rate", type=int, default=60, help="Gemini calls per minute")
+    parser.add_argument("--mode", choices=["single", "stream", "parallel"], default="single")
+    parser.add_argument("--timeout", type=int, default=45, help="seconds per fan-out request")
+    parser.add_argument("--markdown", action="store_true", help="ask for markdown instead of structured JSON")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or fill the shared response cache")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.api_key:
+        print("No API key: pass --api-key or set GEMINI_API_KEY", file=sys.stderr)
+        return 2
+
+    profile = PROFILES[args.profile]
+
+    def model_for(count):
+        model_name = args.model or route_model(profile, count)
+        return get_client(args.api_key, model_name, rate_per_minute=args.rate, max_concurrent=args.concurrency)
+
+    # Same identity as the app uses for the profile, so batch results hit its cache
+    model_name = args.model or profile_cache_id(args.profile)
+    cache = None if args.no_cache else ResponseCache()
+    runner = BatchRunner(model_for, model_name, args.mode, args.timeout, cache, None if args.no_cache else SimilarityIndex(), profile)
+
+    done = load_checkpoint(args.output)
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    # Make sure a line torn by a crash doesn't swallow the first new record
+    if os.path.exists(args.output) and os.path.getsize(args.output):
+        with open(args.output, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+    else:
+        torn = False
+
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(args.concurrency) as executor:
+        if torn:
+            out.write("\n")
+
+        def write(futures):
+            for future in futures:
+                record = future.result()
+                out.write(json.dumps(record) + "\n")
+                counts[record["status"]] += 1
+            out.flush()
+
+        pending = set()
+        try:
+            for line, data in read_requests(args.input):
+                try:
+                    if isinstance(data, Exception):
+                        raise data
+                    request = normalize_request(data, structured=not args.markdown)
+                    key = request_key(request, model_name)
+                except Exception as e:
+                    # A bad row is recorded and skipped; it must never end the run
+                    item_id = str(data.get("id") or f"line-{line}") if isinstance(data, dict) else f"line-{line}"
+                    out.write(json.dumps({"id": item_id, "status": "error", "error": str(e), "error_type": type(e).__name__}) + "\n")
+                    counts["error"] += 1
+                    continue
+
+                item_id = str(data.get("id") or key[:16])
+                if item_id in done:
+                    counts["skipped"] += 1
+                    continue
+                done.add(item_id)
+
+                # Keep only a small window queued so huge inputs are streamed, not loaded
+                if len(pending) >= 2 * args.concurrency:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    write(finished)
+                pending.add(executor.submit(runner.run, item_id, request, key))
+
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write(finished)
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            write(f for f in pending if f.done() and not f.cancelled())
+            print("Interrupted; rerun the same command to resume.", file=sys.stderr)
+            return 130
+
+    elapsed = time.perf_counter() - started
+    processed = counts["ok"] + counts["error"]
+    print(
+        f"{counts['ok']} ok, {counts['error']} errors, {counts['skipped']} already done "
+        f"in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.2f} requests/s)",
+        file=sys.stderr,
+    )
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""Performance benchmarks, run offline against the mock Gemini backend.
+
+    python benchmark.py                                   # 10, 1k and 100k favorites
+    python benchmark.py --sizes 10,1000 --baseline benchmark_baseline.json
+
+Every benchmark is timed ``--repeat`` times for each library size and the
+results are written to ``--output`` as JSON.  With ``--baseline`` any
+benchmark whose median is more than ``--tolerance`` slower than the
+baseline is listed as a regression and the exit status is 1, so a CI step
+can block the deploy.  Full script reruns use Streamlit's AppTest in a
+subprocess per size, so cached resources never leak between libraries.
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import pandas as pd
+import plotly.express as px
+
+from archive import export_archive, import_archive
+from cookbook import CookbookRenderer
+from generation import RecipeStreamParser, build_prompt, generate_recipes, recipe_generation_config
+from matcher import LibraryIndex
+from mock_backend import MockGenerativeModel, fake_recipe
+from recipes import Recipe, parse_recipes, to_markdown
+from storage import RecipeStore
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+PANTRY = ["chicken", "beef", "tofu", "eggs", "tomato", "onion", "spinach", "carrot", "rice", "pasta",
+          "cheese", "milk", "garlic", "lemon", "beans", "mushrooms", "zucchini", "quinoa", "yogurt", "honey"]
+PROFILE = {"allergies": [], "preferred_cuisines": ["Italian"], "skill_level": "Beginner"}
+ADVANCED = {"cooking_time": "Any", "spice_level": 2, "skill_required": "Any", "calories": "Any"}
+# Cookbooks are capped at this many recipes per size; they are laid out per recipe either way
+COOKBOOK_RECIPES = 500
+
+
+def measure(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def summarize(name, size, times):
+    ordered = sorted(times)
+    return {
+        "benchmark": name,
+        "size": size,
+        "repeat": len(times),
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "min": ordered[0],
+        "mean": statistics.fmean(ordered),
+    }
+
+
+# --- Fixtures ---
+def library_user(size):
+    return f"bench-{size}"
+
+
+def populate(store, size, seed=0):
+    """Give ``bench-<size>`` ``size`` favorites and ``size // 10`` history entries, once."""
+    user_id = library_user(size)
+    if store.count_favorites(user_id) == size:
+        return user_id
+    print(f"Building a library of {size} favorites...", file=sys.stderr)
+    rng = random.Random(seed + size)
+
+    def recipe():
+        return Recipe.from_dict(fake_recipe(rng, rng.sample(PANTRY, 3)))
+
+    favorites = [{"recipe": recipe(), "ingredients": ", ".join(rng.sample(PANTRY, 4)), "date_saved": None} for _ in range(size)]
+    history = [{"recipes": [recipe() for _ in range(3)], "ingredients": ", ".join(rng.sample(PANTRY, 4)), "date": None}
+               for _ in range(max(1, size // 10))]
+    store.replace_all(user_id, favorites=favorites, history=history)
+    return user_id
+
+
+# --- Benchmarks ---
+def bench_engine(repeat):
+    """Size-independent paths: prompt building, parsing and the generation engine."""
+    model = MockGenerativeModel()
+    prompt = build_prompt("chicken, rice, garlic", "peanut", "Italian", "Main course", "None", 3, PROFILE, ADVANCED, structured=True)
+    json_text = model.respond(prompt, structured=True)
+    markdown_text = model.respond(prompt, structured=False)
+    chunks = [json_text[i:i + 64] for i in range(0, len(json_text), 64)]
+    config = recipe_generation_config(True)
+
+    def stream_parse():
+        parser = RecipeStreamParser(True)
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+
+    single_prompt = build_prompt("chicken, rice, garlic", "", "Any", "Any", "None", 1, PROFILE, ADVANCED, structured=True)
+    cases = {
+        "build_prompt": lambda: build_prompt("chicken, rice, garlic", "peanut", "Italian", "Main course", "None", 3, PROFILE, ADVANCED, structured=True),
+        "parse_json": lambda: parse_recipes(json_text),
+        "parse_markdown": lambda: parse_recipes(markdown_text),
+        "parse_stream": stream_parse,
+        "render_markdown": lambda: [to_markdown.__wrapped__(r) for r in parse_recipes(json_text)],
+        "generate_single": lambda: generate_recipes(model, prompt, 3, True, "single", config),
+        "generate_stream": lambda: generate_recipes(model, prompt, 3, True, "stream", config),
+        "generate_parallel": lambda: generate_recipes(model, single_prompt, 3, True, "parallel", config),
+    }
+    return [summarize(name, None, measure(fn, repeat)) for name, fn in cases.items()]
+
+
+def bench_library(store, size, repeat):
+    user_id = populate(store, size)
+    page = store.list_favorites(user_id, limit=12)
+
+    def browser_page():
+        # Recipe Browser: count, one page of cards, and the detail view
+        store.count_favorites(user_id)
+        store.list_favorites(user_id, order="A-Z", limit=12, offset=12)
+        to_markdown.__wrapped__(store.get_favorite(user_id, page[0]["id"])["recipe"])
+
+    def browser_search():
+        store.count_favorites(user_id, search="garlic lemon")
+        store.list_favorites(user_id, search="garlic lemon", order="Relevance", limit=12)
+
+    def history_chart():
+        # Sidebar > Recipe History, without the per-version cache
+        daily = pd.DataFrame(store.history_daily(user_id, days=90))
+        store.top_ingredients(user_id, 5)
+        px.line(daily, x="day", y="recipes", title="Recipes Generated per Day")
+
+    def load_recipes(uid):
+        return filter(None, map(store.get_recipe, store.iter_user_recipe_ids(uid)))
+
+    def library_build():
+        LibraryIndex(load_recipes).rank(user_id, ["chicken", "garlic", "rice"], ["peanut"])
+
+    matcher = LibraryIndex(load_recipes)
+    matcher.rank(user_id, ["chicken"])
+
+    def export(compress):
+        # Settings > Export All Data
+        return b"".join(export_archive(store, user_id, PROFILE, compress=compress))
+
+    payload = export(True)
+    import_user = f"{user_id}-import"
+
+    cookbook_recipes = [store.get_recipe(f["id"]) for f in store.list_favorites(user_id, order="A-Z", limit=COOKBOOK_RECIPES)]
+    renderer = CookbookRenderer()
+
+    def cookbook(cold):
+        # Recipe Browser > Cookbook PDF; cold lays out every recipe, warm replays cached layouts
+        (CookbookRenderer() if cold else renderer).write_cookbook(cookbook_recipes, io.BytesIO())
+
+    cookbook(False)
+
+    results = [
+        summarize("browser_page", size, measure(browser_page, repeat)),
+        summarize("browser_search", size, measure(browser_search, repeat)),
+        summarize("history_chart", size, measure(history_chart, repeat)),
+        summarize("library_index_build", size, measure(library_build, repeat)),
+        summarize("library_rank", size, measure(lambda: matcher.rank(user_id, ["chicken", "garlic", "rice"], ["peanut"]), repeat)),
+        summarize("export", size, measure(lambda: export(False), repeat)),
+        summarize("export_gzip", size, measure(lambda: export(True), repeat)),
+        summarize("cookbook_cold", size, measure(lambda: cookbook(True), repeat)),
+        summarize("cookbook_warm", size, measure(lambda: cookbook(False), repeat)),
+        summarize("import", size, measure(lambda: import_archive(store, import_user, io.BytesIO(payload)), repeat, setup=lambda: store.clear(import_user))),
+    ]
+    store.clear(import_user)
+    return results
+
+
+def bench_rerun(db_path, cache_path, size, repeat):
+    """Full script reruns via AppTest, in a fresh interpreter per library size."""
+    env = dict(os.environ, FRIDGEFEAST_DB=db_path, FRIDGEFEAST_CACHE_DB=cache_path, FRIDGEFEAST_BACKEND="mock")
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--apptest-worker", library_user(size), "--repeat", str(repeat)],
+        env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"AppTest run failed:\n{proc.stderr.strip()}")
+    return summarize("app_rerun", size, json.loads(proc.stdout.strip().splitlines()[-1]))
+
+
+def apptest_worker(user_id, repeat):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=300)
+    at.query_params["user"] = user_id
+    # The first run builds the cached resources; only reruns are timed
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception)
+    print(json.dumps(measure(at.run, repeat)))
+
+
+# --- Reporting ---
+def compare(results, baseline, tolerance):
+    """Benchmarks whose median regressed by more than ``tolerance`` (a fraction)."""
+    previous = {(r["benchmark"], r["size"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["benchmark"], result["size"]))
+        if before and result["median"] > before["median"] * (1 + tolerance):
+            regressions.append((result, before))
+    return regressions
+
+
+def print_table(results, baseline=None):
+    previous = {(r["benchmark"], r["size"]): r for r in baseline or []}
+    print(f"{'benchmark':<22}{'size':>8}{'median ms':>12}{'p95 ms':>12}{'vs baseline':>14}")
+    for r in results:
+        before = previous.get((r["benchmark"], r["size"]))
+        change = f"{r['median'] / before['median'] - 1:+.0%}" if before and before["median"] else ""
+        size = "-" if r["size"] is None else r["size"]
+        print(f"{r['benchmark']:<22}{size:>8}{r['median'] * 1000:>12.3f}{r['p95'] * 1000:>12.3f}{change:>14}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark FridgeFeast against the mock Gemini backend.")
+    parser.add_argument("--sizes", default="10,1000,100000", help="comma-separated favorite counts")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--data-dir", default=".benchmark", help="where the generated libraries are kept between runs")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a regression is reported")
+    parser.add_argument("--no-apptest", action="store_true", help="skip full script reruns")
+    parser.add_argument("--apptest-worker", metavar="USER_ID", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.apptest_worker:
+        apptest_worker(args.apptest_worker, args.repeat)
+        return 0
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    db_path = os.path.join(args.data_dir, "library.db")
+    cache_path = os.path.join(args.data_dir, "cache.db")
+    store = RecipeStore(db_path)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    results = bench_engine(args.repeat)
+    for size in sizes:
+        results += bench_library(store, size, args.repeat)
+        if not args.no_apptest:
+            results.append(bench_rerun(db_path, cache_path, size, args.repeat))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    regressions = compare(results, baseline, args.tolerance) if baseline else []
+    for result, before in regressions:
+        size = "" if result["size"] is None else f" @ {result['size']}"
+        print(f"REGRESSION {result['benchmark']}{size}: {before['median'] * 1000:.3f} ms -> {result['median'] * 1000:.3f} ms", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Persistent response cache for Gemini recipe generations.
+
+Entries live in a small SQLite file so they are shared by every Streamlit
+session and by every process pointing at the same path.  Keys are derived
+from a canonical form of the ``build_prompt`` inputs, so cosmetic
+differences (ingredient order, casing, stray whitespace) still hit.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from db import LocalConnection
+from metrics import inc
+
+
+DEFAULT_CACHE_PATH = os.environ.get("FRIDGEFEAST_CACHE_DB", "fridgefeast_cache.db")
+
+
+def normalize_items(items):
+    """Lowercase, strip, dedupe and sort a comma string or list of items."""
+    if isinstance(items, str):
+        items = items.split(",")
+    return sorted({i.strip().lower() for i in items if i and i.strip()})
+
+
+def canonical_request(ingredients, avoid_ingredients, cuisine, meal_type, diet, count,
+                      user_profile, advanced_options=None, model_name="", structured=False):
+    user_profile = user_profile or {}
+    return {
+        "ingredients": normalize_items(ingredients),
+        "avoid": normalize_items(avoid_ingredients),
+        "cuisine": cuisine,
+        "meal_type": meal_type,
+        "diet": diet,
+        "count": count,
+        "preferred_cuisines": sorted(user_profile.get("preferred_cuisines", [])),
+        "skill_level": user_profile.get("skill_level"),
+        "advanced": advanced_options or {},
+        "model": model_name,
+        "structured": structured,
+    }
+
+
+def make_cache_key(*args, **kwargs):
+    """Stable hash of :func:`canonical_request` for the same arguments."""
+    canonical = json.dumps(canonical_request(*args, **kwargs), sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed LRU cache with TTL expiry and entry/byte caps."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=2000,
+                 max_bytes=64 * 1024 * 1024, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._conn = LocalConnection(path)
+        self._init_schema()
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access);
+            CREATE INDEX IF NOT EXISTS idx_entries_created_at ON entries(created_at);
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats (name, value) VALUES ('hits', 0), ('misses', 0);
+        """)
+
+    def _bump(self, conn, name):
+        conn.execute("UPDATE stats SET value = value + 1 WHERE name = ?", (name,))
+
+    def get(self, key):
+        """Return the cached response text for ``key`` or ``None`` on a miss."""
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT response, created_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+            if row is not None:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._bump(conn, "misses")
+            inc("response_cache_lookups_total", result="miss")
+            return None
+        conn.execute(
+            "UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+        )
+        self._bump(conn, "hits")
+        inc("response_cache_lookups_total", result="hit")
+        return row[0]
+
+    def put(self, key, response, model=""):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, model, response, size, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, response, len(response.encode("utf-8")), now, now),
+        )
+        self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        if self.max_bytes:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_access DESC) AS running "
+                "FROM entries) WHERE running > ?)",
+                (self.max_bytes,),
+            )
+
+    def stats(self):
+        conn = self._conn()
+        counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = counters.get("hits", 0) + counters.get("misses", 0)
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "hit_rate": counters.get("hits", 0) / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM entries")
+        conn.execute("UPDATE stats SET value = 0")
@@ -0,0 +1,335 @@
+"""Cookbook PDF export.
+
+A cookbook is a cover page, a table of contents and every recipe starting
+on a page of its own, drawn with fpdf's built-in fonts.  Word wrapping and
+pagination are the expensive part, so each recipe is laid out once into
+pages of ``(style, text, indent)`` lines and cached under its content hash:
+exporting the library again after saving one recipe only lays out the new
+one and replays the rest.  Since every page count is known before anything
+is drawn, the contents pages are written first, with real page numbers and
+links.  With fpdf 1.7 the finished document is written straight to the
+output file as fpdf produces it rather than assembled in one string first;
+other versions fall back to ``output(dest="S")``.
+
+The built-in fonts only cover Latin-1, so text is folded to it first:
+typographic quotes and dashes become ASCII and emoji are dropped.
+"""
+
+import io
+import re
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import fpdf
+from fpdf import FPDF
+
+from metrics import inc, span
+
+
+# A4 portrait, in mm
+PAGE_WIDTH, PAGE_HEIGHT = 210, 297
+MARGIN = 18
+TEXT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+# Lines stop here, leaving room for the page number
+TEXT_BOTTOM = PAGE_HEIGHT - MARGIN - 8
+PAGE_NUMBER_WIDTH = 14
+LIST_INDENT = 6
+FONT = "Helvetica"
+# style -> (font style, size in pt, line height in mm)
+STYLES = {
+    "title": ("B", 20, 10),
+    "description": ("I", 11, 6),
+    "facts": ("", 9, 5),
+    "heading": ("B", 13, 9),
+    "body": ("", 11, 6),
+    "toc": ("", 11, 7),
+    "gap": ("", 11, 4),
+}
+GAP = ("gap", "", 0)
+# _FileBuffer relies on how fpdf 1.7 grows its private ``buffer`` string
+STREAMING = getattr(fpdf, "__version__", "").startswith("1.7.")
+
+_LATIN1 = str.maketrans({
+    "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"',
+    "\u2013": "-", "\u2014": "-", "\u2212": "-", "\u2022": "-",
+    "\u2026": "...", "\u2009": " ", "\u202f": " ",
+    "\u2153": "1/3", "\u2154": "2/3", "\u215b": "1/8",
+})
+_MARKUP = re.compile(r"\*\*|__|[*`]")
+_LIST_ITEM = re.compile(r"^([-*+]|\d+[.)])\s+")
+
+
+def to_latin1(text):
+    """Fold ``text`` into what the built-in PDF fonts can draw, on one line."""
+    text = str(text).translate(_LATIN1).encode("latin-1", "ignore").decode("latin-1")
+    return " ".join(text.split())
+
+
+class _FileBuffer:
+    """Stands in for fpdf's output string, writing each piece to ``fileobj`` as it arrives.
+
+    fpdf grows the document with ``buffer += text``, which copies the whole
+    string every time, and only reads ``len(buffer)`` for object offsets.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.size = 0
+
+    def __iadd__(self, text):
+        data = text.encode("latin-1")
+        self.fileobj.write(data)
+        self.size += len(data)
+        return self
+
+    def __len__(self):
+        return self.size
+
+
+def paginate(lines):
+    """Split laid-out lines into pages; headings are never left at the foot of a page."""
+    pages, page, y = [], [], MARGIN
+    for line in lines:
+        height = STYLES[line[0]][2]
+        needed = height + (2 * STYLES["body"][2] if line[0] == "heading" else 0)
+        if page and y + needed > TEXT_BOTTOM:
+            pages.append(page)
+            page, y = [], MARGIN
+            if line[0] == "gap":
+                continue
+        page.append(line)
+        y += height
+    pages.append(page)
+    return pages
+
+
+class _CookbookPDF(FPDF):
+    def __init__(self, fileobj, footer_text=""):
+        super().__init__("P", "mm", "A4")
+        self.fileobj = fileobj
+        if STREAMING:
+            self.buffer = _FileBuffer(fileobj)
+        self.footer_text = footer_text
+        self.set_margins(MARGIN, MARGIN)
+        self.set_auto_page_break(False)
+
+    def footer(self):
+        if self.page_no() == 1 and self.footer_text:
+            return  # the cover
+        self.set_xy(MARGIN, PAGE_HEIGHT - MARGIN)
+        self.set_font(FONT, "I", 8)
+        label = f"{self.footer_text} - {self.page_no()}" if self.footer_text else str(self.page_no())
+        self.cell(TEXT_WIDTH, 5, label, 0, 0, "C")
+
+    def finish(self):
+        """Complete the document and make sure all of it has reached ``fileobj``."""
+        if STREAMING:
+            self.close()
+            return
+        data = self.output(dest="S")
+        self.fileobj.write(data.encode("latin-1") if isinstance(data, str) else bytes(data))
+
+
+class CookbookRenderer:
+    """Lays out recipes for print, caching each layout by recipe id (a content hash)."""
+
+    def __init__(self, max_layouts=4096, max_documents=256):
+        self.max_layouts = max_layouts
+        self.max_documents = max_documents
+        self._layouts = OrderedDict()
+        # Single-recipe PDFs, rebuilt on every rerun that shows a Print button otherwise
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+        # Only used for measuring text; fpdf objects aren't thread-safe, hence the lock
+        self._measure = FPDF("P", "mm", "A4")
+
+    # --- Layout ---
+    def _width(self, text):
+        return self._measure.get_string_width(text)
+
+    def _wrap(self, style, text, indent=0, hanging=0):
+        """``(style, text, indent)`` lines for one paragraph; continuation lines are indented by ``hanging``."""
+        text = to_latin1(_MARKUP.sub("", text))
+        font_style, size, _ = STYLES[style]
+        self._measure.set_font(FONT, font_style, size)
+        space = self._width(" ")
+        lines, words, used, offset = [], [], 0.0, indent
+        for word in text.split(" "):
+            width = self._width(word)
+            if words and used + space + width > TEXT_WIDTH - offset:
+                lines.append((style, " ".join(words), offset))
+                words, used, offset = [], 0.0, indent + hanging
+            # A single word wider than the line (a URL, say) is cut where it overflows
+            while width > TEXT_WIDTH - offset and len(word) > 1:
+                cut = len(word) - 1
+                while cut > 1 and self._width(word[:cut]) > TEXT_WIDTH - offset:
+                    cut -= 1
+                lines.append((style, word[:cut], offset))
+                word, offset = word[cut:], indent + hanging
+                width = self._width(word)
+            used += (space if words else 0) + width
+            words.append(word)
+        if words:
+            lines.append((style, " ".join(words), offset))
+        return lines
+
+    def _list_item(self, text):
+        return self._wrap("body", text, hanging=LIST_INDENT)
+
+    def _markdown_lines(self, markdown):
+        lines, titled = [], False
+        for raw in markdown.splitlines():
+            raw = raw.strip()
+            if not raw or set(raw) <= set("-*_="):
+                if lines and lines[-1] != GAP:
+                    lines.append(GAP)
+            elif raw.startswith("#"):
+                style = "heading" if titled else "title"
+                titled = True
+                if lines and lines[-1] != GAP:
+                    lines.append(GAP)
+                lines += self._wrap(style, raw.lstrip("#"))
+            elif _LIST_ITEM.match(raw):
+                lines += self._list_item(_LIST_ITEM.sub(lambda m: "- " if m.group(1) in "-*+" else m.group(1) + " ", raw))
+            else:
+                lines += self._wrap("body", raw)
+        return lines
+
+    def _recipe_lines(self, recipe):
+        if recipe.markdown:
+            return self._markdown_lines(recipe.markdown)
+
+        lines = self._wrap("title", recipe.title)
+        if recipe.description:
+            lines += [GAP] + self._wrap("description", recipe.description)
+        facts = " | ".join(
+            f"{label}: {value}"
+            for label, value in (
+                ("Time", recipe.time),
+                ("Difficulty", recipe.difficulty),
+                ("Calories", recipe.calories),
+                ("Servings", recipe.servings),
+            )
+            if value
+        )
+        if facts:
+            lines += [GAP] + self._wrap("facts", facts)
+        if recipe.ingredients:
+            lines += [GAP, ("heading", "Ingredients", 0)]
+            for i in recipe.ingredients:
+                lines += self._list_item(f"- {i.quantity} {i.name}" if i.quantity else f"- {i.name}")
+        if recipe.steps:
+            lines += [GAP, ("heading", "Instructions", 0)]
+            for n, step in enumerate(recipe.steps, 1):
+                lines += self._list_item(f"{n}. {step}")
+        return lines
+
+    def layout(self, recipe):
+        """The recipe as a list of pages, each a list of ``(style, text, indent)`` lines."""
+        with self._lock:
+            pages = self._layouts.get(recipe.id)
+            if pages is not None:
+                self._layouts.move_to_end(recipe.id)
+                inc("cookbook_layouts_total", result="hit")
+                return pages
+            inc("cookbook_layouts_total", result="miss")
+            pages = paginate(self._recipe_lines(recipe))
+            self._layouts[recipe.id] = pages
+            while len(self._layouts) > self.max_layouts:
+                self._layouts.popitem(last=False)
+            return pages
+
+    def _fit(self, style, text, width):
+        """``text`` cut down with an ellipsis until it fits ``width``."""
+        with self._lock:
+            font_style, size, _ = STYLES[style]
+            self._measure.set_font(FONT, font_style, size)
+            if self._width(text) <= width:
+                return text
+            while text and self._width(text + "...") > width:
+                text = text[:-1]
+            return text.rstrip() + "..."
+
+    # --- Drawing ---
+    @staticmethod
+    def _draw_page(pdf, lines, links=None):
+        """Draw one laid-out page; ``links`` maps TOC lines to ``(link, page number)`` in order."""
+        pdf.add_page()
+        y, current = MARGIN, None
+        for style, text, indent in lines:
+            font_style, size, height = STYLES[style]
+            if text:
+                if current != style:
+                    pdf.set_font(FONT, font_style, size)
+                    current = style
+                pdf.set_xy(MARGIN + indent, y)
+                if style == "toc":
+                    link, page = next(links)
+                    pdf.cell(TEXT_WIDTH - PAGE_NUMBER_WIDTH, height, text, 0, 0, "", 0, link)
+                    pdf.cell(PAGE_NUMBER_WIDTH, height, str(page), 0, 0, "R", 0, link)
+                else:
+                    pdf.cell(TEXT_WIDTH - indent, height, text)
+            y += height
+
+    def write_cookbook(self, recipes, fileobj, title="My Cookbook"):
+        """Write ``recipes`` (any iterable) to ``fileobj`` as one PDF and return its page count."""
+        with span("cookbook_export_seconds"):
+            title = to_latin1(title) or "Cookbook"
+            entries, layouts = [], []
+            for recipe in recipes:
+                entries.append(self._fit("toc", to_latin1(recipe.title) or "Recipe", TEXT_WIDTH - PAGE_NUMBER_WIDTH - 2))
+                layouts.append(self.layout(recipe))
+
+            contents = paginate([("title", "Contents", 0), GAP] + [("toc", entry, 0) for entry in entries])
+            # Page 1 is the cover, then the contents, then each recipe in turn
+            starts, page = [], 2 + len(contents)
+            for pages in layouts:
+                starts.append(page)
+                page += len(pages)
+
+            pdf = _CookbookPDF(fileobj, title)
+            pdf.set_title(title)
+            pdf.add_page()
+            pdf.set_xy(MARGIN, PAGE_HEIGHT / 3)
+            pdf.set_font(FONT, "B", 30)
+            pdf.cell(TEXT_WIDTH, 14, title, 0, 1, "C")
+            pdf.set_font(FONT, "", 12)
+            pdf.set_x(MARGIN)
+            count = f"{len(layouts)} recipe" + ("" if len(layouts) == 1 else "s")
+            pdf.cell(TEXT_WIDTH, 8, f"{count} - {date.today():%d %B %Y}", 0, 1, "C")
+
+            links = [pdf.add_link() for _ in layouts]
+            toc = iter(zip(links, starts))
+            for lines in contents:
+                self._draw_page(pdf, lines, toc)
+            for link, pages in zip(links, layouts):
+                for n, lines in enumerate(pages):
+                    self._draw_page(pdf, lines)
+                    if n == 0:
+                        pdf.set_link(link, 0)
+            pdf.finish()
+            return pdf.page_no()
+
+    def recipe_pdf(self, recipe):
+        """A single recipe as PDF bytes, without cover or contents."""
+        with self._lock:
+            data = self._documents.get(recipe.id)
+            if data is not None:
+                self._documents.move_to_end(recipe.id)
+                return data
+        buffer = io.BytesIO()
+        pdf = _CookbookPDF(buffer)
+        pdf.set_title(to_latin1(recipe.title))
+        for lines in self.layout(recipe):
+            self._draw_page(pdf, lines)
+        pdf.finish()
+        data = buffer.getvalue()
+        with self._lock:
+            self._documents[recipe.id] = data
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+        return data
+
+    def __len__(self):
+        return len(self._layouts)
@@ -0,0 +1,29 @@
+"""SQLite connections shared by the response cache, similarity index and recipe store."""
+
+import sqlite3
+import threading
+
+
+class LocalConnection:
+    """One WAL-mode connection per thread to the database at ``path``.
+
+    SQLite connections can't be shared between threads, so calling the
+    instance opens (once per thread) and returns that thread's connection.
+    ``setup`` runs on every new connection, e.g. to register SQL functions.
+    """
+
+    def __init__(self, path, setup=None):
+        self.path = path
+        self.setup = setup
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if self.setup is not None:
+                self.setup(conn)
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,333 @@
+"""Shared Gemini client layer.
+
+``genai.configure`` is process-global, so configuring it on every rerun
+races between sessions using different keys.  Instead each API key gets one
+model handle, built once under a lock and bound to its own transport.  Every
+call through a handle passes a per-key token bucket and concurrency limit,
+retries quota and transient errors with jittered exponential backoff, and
+trips a circuit breaker while the upstream keeps failing.
+
+Successful calls also feed a per-model latency tracker, which
+:func:`route_model` uses to move traffic off a model that has slowed down.
+"""
+
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+from google.generativeai import client as genai_client
+
+from metrics import inc, observe, record_usage
+from mock_backend import MockGenerativeModel
+
+
+# "mock" swaps Gemini for mock_backend.MockGenerativeModel (benchmarks, offline demos)
+BACKEND = os.environ.get("FRIDGEFEAST_BACKEND", "gemini")
+RATE_PER_MINUTE = int(os.environ.get("FRIDGEFEAST_RATE_PER_MINUTE", 60))
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("FRIDGEFEAST_MAX_CONCURRENT_REQUESTS", 8))
+
+RETRYABLE_ERRORS = (
+    api_exceptions.ResourceExhausted,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.InternalServerError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling Gemini while the circuit breaker is open."""
+
+    def __init__(self, retry_in):
+        super().__init__(f"Gemini is temporarily unavailable; retrying in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class TokenBucket:
+    """Blocking token bucket: ``rate`` tokens per second, bursts up to ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures, probes again after ``reset_seconds``."""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return "open"
+            return "half-open"
+
+    def before_call(self):
+        """Raise :class:`CircuitOpenError` unless a call may go through."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            elapsed = time.monotonic() - self._opened_at
+            # Once the cool-down is over a single probe call is let through
+            if elapsed < self.reset_seconds or self._probing:
+                raise CircuitOpenError(max(0.0, self.reset_seconds - elapsed))
+            self._probing = True
+
+    def cancel_call(self):
+        """Give back a probe let through by :meth:`before_call` when the call was never made."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class LatencyTracker:
+    """Recent request latencies per model; samples older than ``horizon`` seconds are ignored.
+
+    Once a slow model stops getting traffic its samples age out, so it is
+    tried again after ``horizon`` seconds.
+    """
+
+    def __init__(self, window=20, horizon=300):
+        self.window = window
+        self.horizon = horizon
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _name(model_name):
+        return model_name.removeprefix("models/")
+
+    def record(self, model_name, seconds):
+        with self._lock:
+            samples = self._samples.setdefault(self._name(model_name), deque(maxlen=self.window))
+            samples.append((time.monotonic(), seconds))
+
+    def median(self, model_name):
+        """Median recent latency in seconds, or ``None`` without recent samples."""
+        cutoff = time.monotonic() - self.horizon
+        with self._lock:
+            recent = sorted(s for t, s in self._samples.get(self._name(model_name), ()) if t >= cutoff)
+        return recent[len(recent) // 2] if recent else None
+
+
+LATENCY = LatencyTracker()
+
+
+def route_model(profile, count, surprise=False, tracker=LATENCY):
+    """Pick the model for a request of ``count`` recipes under a generation profile.
+
+    Surprises and single recipes go to the profile's lite model when it has
+    one.  While the chosen model's median latency is over the profile's
+    ``latency_threshold`` the other model is used instead, unless it is
+    known to be even slower.
+    """
+    preferred = profile["model"]
+    if (surprise or count == 1) and profile.get("lite_model"):
+        preferred = profile["lite_model"]
+    fallback = profile["fallback_model"] if preferred == profile["model"] else profile["model"]
+    if not fallback or fallback == preferred:
+        return preferred
+    latency = tracker.median(preferred)
+    if latency is None or latency <= profile["latency_threshold"]:
+        return preferred
+    other = tracker.median(fallback)
+    if other is not None and other >= latency:
+        return preferred
+    inc("model_fallbacks_total", model=preferred, fallback=fallback)
+    return fallback
+
+
+class _StreamResponse:
+    """Streaming response that holds its concurrency slot until fully read."""
+
+    def __init__(self, response, release, model_name, started):
+        self._response = response
+        self._release = release
+        self._model_name = model_name
+        self._started = started
+
+    def __iter__(self):
+        try:
+            yield from self._response
+            # Usage metadata is only complete once the last chunk has arrived
+            record_usage(self._response, self._model_name)
+            LATENCY.record(self._model_name, time.perf_counter() - self._started)
+        finally:
+            observe("gemini_request_seconds", time.perf_counter() - self._started, model=self._model_name, stream=True)
+            self._release()
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class GeminiClient:
+    """Rate-limited, retrying wrapper exposing ``generate_content`` like ``GenerativeModel``."""
+
+    def __init__(self, model, bucket, semaphore, breaker, max_retries=4,
+                 base_delay=1.0, max_delay=20.0, acquire_timeout=60):
+        self.model = model
+        self.model_name = model.model_name
+        self.bucket = bucket
+        self.semaphore = semaphore
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.acquire_timeout = acquire_timeout
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retrying sessions from hitting the quota in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def generate_content(self, *args, stream=False, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                inc("gemini_errors_total", model=self.model_name, type="CircuitOpenError")
+                raise
+            # A half-open breaker would otherwise wait forever for a probe that never ran
+            if not self.bucket.acquire(self.acquire_timeout):
+                self.breaker.cancel_call()
+                raise api_exceptions.TooManyRequests("Local Gemini rate limit is saturated")
+            if not self.semaphore.acquire(timeout=self.acquire_timeout):
+                self.breaker.cancel_call()
+                raise api_exceptions.TooManyRequests("Too many Gemini requests in flight")
+            started = time.perf_counter()
+            try:
+                response = self.model.generate_content(*args, stream=stream, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                self.semaphore.release()
+                self.breaker.record_failure()
+                inc("gemini_errors_total", model=self.model_name, type=type(e).__name__)
+                if attempt >= self.max_retries:
+                    raise
+                inc("gemini_retries_total", model=self.model_name)
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            except api_exceptions.GoogleAPICallError as e:
+                # Bad requests and rejected keys still mean the upstream answered
+                self.semaphore.release()
+                self.breaker.record_success()
+                inc("gemini_errors_total", model=self.model_name, type=type(e).__name__)
+                raise
+            except Exception as e:
+                self.semaphore.release()
+                self.breaker.record_failure()
+                inc("gemini_errors_total", model=self.model_name, type=type(e).__name__)
+                raise
+            self.breaker.record_success()
+            if stream:
+                # The SDK blocks until the first chunk, so this is the time to first token
+                observe("gemini_time_to_first_token_seconds", time.perf_counter() - started, model=self.model_name)
+                # Only the opening request is retried; a broken stream would duplicate output
+                return _StreamResponse(response, self.semaphore.release, self.model_name, started)
+            self.semaphore.release()
+            elapsed = time.perf_counter() - started
+            observe("gemini_request_seconds", elapsed, model=self.model_name, stream=False)
+            LATENCY.record(self.model_name, elapsed)
+            record_usage(response, self.model_name)
+            return response
+
+
+_lock = threading.Lock()
+_clients = {}
+_limits = {}
+
+
+def _key_id(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def get_client(api_key, model_name, rate_per_minute=None, max_concurrent=None):
+    """Return the process-wide client for ``api_key`` and ``model_name``.
+
+    The rate limit and concurrency cap are shared by every model used with
+    the same key, since that is how Gemini applies its quota; overrides only
+    apply the first time a key is seen.
+    """
+    key_id = _key_id(api_key)
+    with _lock:
+        client = _clients.get((key_id, model_name))
+        if client is not None:
+            return client
+        if key_id not in _limits:
+            rate = rate_per_minute or RATE_PER_MINUTE
+            _limits[key_id] = (
+                TokenBucket(rate / 60, max(1, rate // 6)),
+                threading.BoundedSemaphore(max_concurrent or MAX_CONCURRENT_REQUESTS),
+            )
+        bucket, semaphore = _limits[key_id]
+        if BACKEND == "mock":
+            model = MockGenerativeModel.from_env(model_name)
+        else:
+            # Bind the transport now so later configure() calls for other keys don't affect it
+            genai.configure(api_key=api_key)
+            model = genai.GenerativeModel(model_name)
+            model._client = genai_client.get_default_generative_client()
+        client = GeminiClient(model, bucket, semaphore, CircuitBreaker())
+        _clients[(key_id, model_name)] = client
+        return client
+
+
+def friendly_error(error):
+    """Short message for showing a failed Gemini call to a user."""
+    if isinstance(error, CircuitOpenError):
+        return f"Gemini is having trouble right now, so requests are paused. Please try again in {error.retry_in:.0f} seconds."
+    if isinstance(error, (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)):
+        return "Gemini is busy right now (rate limit reached). Please try again in a minute."
+    if isinstance(error, (api_exceptions.DeadlineExceeded, TimeoutError)):
+        return "Gemini took too long to answer. Please try again."
+    if isinstance(error, (api_exceptions.ServiceUnavailable, api_exceptions.InternalServerError)):
+        return "Gemini is temporarily unavailable. Please try again shortly."
+    if isinstance(error, (api_exceptions.PermissionDenied, api_exceptions.Unauthenticated)):
+        return "Gemini rejected the API key. Please check it in the sidebar."
+    if isinstance(error, api_exceptions.InvalidArgument) and "API key" in str(error):
+        return "Gemini rejected the API key. Please check it in the sidebar."
+    return f"Something went wrong: {error}"
@@ -0,0 +1,467 @@
+"""Recipe generation engine: prompt building, Gemini calls and output parsing.
+
+Nothing here depends on Streamlit, so the app and the ``batch`` CLI share it.
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+from allergens import describe
+from jobs import Job
+from metrics import observe, span, timed
+from recipes import RECIPE_LIST_SCHEMA, RECIPE_SEPARATOR, Recipe, parse_recipes
+
+
+MODEL_NAME = "gemini-2.0-flash"
+LITE_MODEL_NAME = "gemini-2.0-flash-lite"
+
+
+# --- Profiles ---
+# Output tokens drive both latency and cost, so every profile caps them per recipe.
+# ``latency_threshold`` is the median request time (seconds) past which
+# gemini_client.route_model switches to the other model.
+PROFILES = {
+    "fast": {
+        "model": LITE_MODEL_NAME,
+        "lite_model": LITE_MODEL_NAME,
+        "fallback_model": MODEL_NAME,
+        "tokens_per_recipe": 450,
+        "temperature": 0.7,
+        "compact": True,
+        "latency_threshold": 8,
+    },
+    "balanced": {
+        "model": MODEL_NAME,
+        "lite_model": LITE_MODEL_NAME,
+        "fallback_model": LITE_MODEL_NAME,
+        "tokens_per_recipe": 800,
+        "temperature": 1.0,
+        "compact": False,
+        "latency_threshold": 20,
+    },
+    "rich": {
+        "model": MODEL_NAME,
+        "lite_model": None,
+        "fallback_model": LITE_MODEL_NAME,
+        "tokens_per_recipe": 1400,
+        "temperature": 1.1,
+        "compact": False,
+        "latency_threshold": 40,
+    },
+}
+DEFAULT_PROFILE = "balanced"
+# Room for the JSON array brackets or separators around the recipes
+RESPONSE_OVERHEAD_TOKENS = 64
+
+
+def output_token_budget(profile, count):
+    return RESPONSE_OVERHEAD_TOKENS + profile["tokens_per_recipe"] * count
+
+
+def profile_cache_id(name):
+    """Model identity used in cache keys; a fallback model's answers still count for the profile."""
+    return f"{PROFILES[name]['model']}:{name}"
+
+
+# --- Prompt ---
+@timed("build_prompt_seconds")
+def build_prompt(ingredients, avoid_ingredients, cuisine, meal_type, diet, count, user_profile, advanced_options=None, structured=False, compact=False):
+    """Prompt for ``count`` recipes; ``structured`` asks for JSON matching :data:`RECIPE_LIST_SCHEMA`.
+
+    ``compact`` asks for terse recipes, which keeps output tokens (and so
+    latency) down for the "fast" profile.
+    """
+    if structured:
+        format_instructions = "Return the recipes as a JSON array matching the provided response schema. Give quantities in each ingredient's quantity field and write steps as plain sentences without numbering."
+    else:
+        format_instructions = "Present each recipe in a clean, simple markdown format. Use ## headings for recipe titles and single # only for the main sections. Use bullet points for ingredients and numbered lists for instructions."
+
+    if compact:
+        prompt = f"""Create {count} unique, simple recipes from the following ingredients: {ingredients}.
+Each recipe needs a short title, a one-sentence description, ingredients with quantities, at most 6 brief steps, cooking time, difficulty, calories per serving and servings. No extra commentary.
+{format_instructions}
+"""
+        if avoid_ingredients:
+            prompt += f"Do not use: {avoid_ingredients}.\n"
+    else:
+        prompt = f"""
+You are a creative and friendly recipe assistant. Create {count} unique, simple, and delicious recipes based on the following ingredients: {ingredients}.
+
+Each recipe MUST include:
+- A creative and engaging title
+- A short description (2-3 sentences)
+- A clear list of ingredients with quantities
+- Easy-to-follow instructions (step-by-step)
+- Estimated cooking time
+- Difficulty level
+- Calories estimate (per serving)
+- Servings
+
+{format_instructions}
+
+If specified, avoid using these ingredients: {avoid_ingredients}.
+"""
+    # Add cuisine preference
+    if cuisine != "Any":
+        prompt += f"The recipes should follow {cuisine} cuisine.\n"
+    elif user_profile.get("preferred_cuisines"):
+        prompt += f"Consider these favorite cuisines if relevant: {', '.join(user_profile['preferred_cuisines'])}.\n"
+
+    # Add meal type
+    if meal_type != "Any":
+        prompt += f"The recipes should be suitable for {meal_type.lower()}.\n"
+
+    # Add dietary preference
+    if diet != "None":
+        prompt += f"All recipes must follow a {diet.lower()} diet.\n"
+
+    # Advanced options
+    if advanced_options:
+        if advanced_options.get("cooking_time") and advanced_options["cooking_time"] != "Any":
+            prompt += f"Recipes should be prepared {advanced_options['cooking_time'].lower()}.\n"
+
+        if advanced_options.get("spice_level"):
+            spice_desc = ["very mild", "mild", "medium", "spicy", "very spicy"][advanced_options["spice_level"]-1]
+            prompt += f"Spice level should be {spice_desc}.\n"
+
+        if advanced_options.get("skill_required") and advanced_options["skill_required"] != "Any":
+            prompt += f"Recipes should be appropriate for {advanced_options['skill_required'].lower()} cooks.\n"
+        elif user_profile.get("skill_level"):
+            prompt += f"Assume the cook has {user_profile['skill_level'].lower()} skill level.\n"
+
+        if advanced_options.get("calories") and advanced_options["calories"] != "Any":
+            prompt += f"Recipes should be {advanced_options['calories'].lower()}.\n"
+
+    if not structured:
+        prompt += "Separate recipes with a horizontal rule (---)."
+        if not compact:
+            prompt += " Make the output fun and engaging."
+    elif not compact:
+        prompt += "Make the titles and descriptions fun and engaging."
+    return prompt
+
+
+def recipe_generation_config(structured, profile=None, count=1):
+    """Gemini generation config, or ``None`` when the defaults apply.
+
+    ``structured`` asks for schema-shaped JSON; a ``profile`` adds its
+    temperature and an output-token cap sized for ``count`` recipes per call.
+    """
+    config = {}
+    if structured:
+        config.update(response_mime_type="application/json", response_schema=RECIPE_LIST_SCHEMA)
+    if profile:
+        config.update(max_output_tokens=output_token_budget(profile, count), temperature=profile["temperature"])
+    return config or None
+
+
+# --- Streaming ---
+class RecipeStreamSplitter:
+    """Incrementally split streamed text on the recipe separator.
+
+    ``feed`` returns the recipes completed by the new chunk; whatever follows
+    the last separator stays in ``pending`` until more text (or ``close``)
+    arrives.  A separator cut in half by a chunk boundary is handled because
+    the search always runs over the whole pending buffer.
+    """
+
+    def __init__(self, separator=RECIPE_SEPARATOR):
+        self.separator = separator
+        self.pending = ""
+        self.text = ""
+
+    def feed(self, chunk):
+        self.text += chunk
+        self.pending += chunk
+        parts = self.pending.split(self.separator)
+        self.pending = parts.pop()
+        return [p for p in parts if p.strip()]
+
+    def close(self):
+        remainder, self.pending = self.pending, ""
+        return [remainder] if remainder.strip() else []
+
+
+class JsonArrayStreamSplitter:
+    """Incrementally pull complete objects out of a streamed JSON array.
+
+    Structured output arrives as ``[{...}, {...}]``; each top-level object
+    is decoded as soon as its closing brace is seen.  The scanner keeps its
+    position between chunks so every character is visited once.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk):
+        self.text += chunk
+        objects = []
+        text = self.text
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if char == "{" and self._depth == 2 and self._start is None:
+                    self._start = pos
+            elif char in "}]":
+                self._depth -= 1
+                if char == "}" and self._depth == 1 and self._start is not None:
+                    objects.append(json.loads(text[self._start:pos + 1]))
+                    self._start = None
+        self._pos = len(text)
+        return objects
+
+    def close(self):
+        # A bare top-level object (no array) is still a valid single recipe
+        if not self.text.strip().startswith("["):
+            try:
+                return [json.loads(self.text)]
+            except ValueError:
+                return []
+        return []
+
+
+class RecipeStreamParser:
+    """Turn streamed response text into validated :class:`Recipe` objects."""
+
+    def __init__(self, structured):
+        self.structured = structured
+        self._splitter = JsonArrayStreamSplitter() if structured else RecipeStreamSplitter()
+
+    @property
+    def preview(self):
+        # Partial markdown is readable; partial JSON is not worth showing
+        return "" if self.structured else self._splitter.pending
+
+    def _recipes(self, parts):
+        if self.structured:
+            return [Recipe.from_dict(p) for p in parts]
+        return [Recipe.from_markdown(p) for p in parts]
+
+    def feed(self, chunk):
+        return self._recipes(self._splitter.feed(chunk))
+
+    def close(self):
+        return self._recipes(self._splitter.close())
+
+
+def hit_token_limit(response):
+    """Whether Gemini stopped because the response reached ``max_output_tokens``."""
+    for candidate in getattr(response, "candidates", None) or ():
+        reason = getattr(candidate, "finish_reason", None)
+        if getattr(reason, "name", reason) == "MAX_TOKENS":
+            return True
+    return False
+
+
+TRUNCATED_NOTE = (
+    "The response reached its output-token limit, so the recipe it was writing was cut off and left out. "
+    "The Rich profile or fewer recipes leaves more room."
+)
+
+
+def complete_recipes(response):
+    """``(recipes, truncated)`` for a finished response; a recipe cut off by the token limit is dropped."""
+    text = response.text
+    if not hit_token_limit(response):
+        return parse_recipes(text), False
+    if text.lstrip().startswith(("[", "{")):
+        # parse_recipes already keeps only the objects that were closed
+        try:
+            return parse_recipes(text), True
+        except ValueError:
+            return [], True
+    # In markdown the cut-off recipe is whatever follows the last separator
+    return (parse_recipes(text.rsplit(RECIPE_SEPARATOR, 1)[0]) if RECIPE_SEPARATOR in text else []), True
+
+
+def iter_stream_text(response):
+    """Yield the text of each chunk of a streamed ``generate_content`` call."""
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks that only carry finish/safety metadata have no text part
+            continue
+        if text:
+            yield text
+
+
+# --- Parallel fan-out ---
+DIVERSITY_HINTS = [
+    "a quick weeknight dish that comes together fast",
+    "a comforting baked, braised or slow-cooked dish",
+    "a light and fresh dish such as a salad, bowl or stir-fry",
+    "a bold dish inspired by a different regional cuisine",
+    "a creative twist on a well-known classic",
+]
+
+
+def with_diversity_hint(prompt, index):
+    """Steer one of several single-recipe prompts away from its siblings."""
+    hint = DIVERSITY_HINTS[index % len(DIVERSITY_HINTS)]
+    return prompt + f"\nThis is recipe {index + 1} of a set, so make it distinct: create {hint}."
+
+
+def generate_concurrently(generate, prompts, timeout=45, max_workers=None):
+    """Run ``generate(prompt)`` for every prompt on a thread pool.
+
+    Yields ``(index, text, error)`` tuples in completion order.  A failing
+    or slow request only affects its own slot: once ``timeout`` seconds have
+    passed the remaining requests are abandoned and reported as timeouts.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(prompts))
+    futures = {executor.submit(generate, prompt): i for i, prompt in enumerate(prompts)}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+    except FuturesTimeout:
+        for future in pending:
+            if future.done():
+                yield futures[future], None if future.exception() else future.result(), future.exception()
+            else:
+                future.cancel()
+                yield futures[future], None, TimeoutError(f"No response after {timeout} seconds")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Job runners ---
+# These run on a worker thread and report progress through a jobs.Job; they
+# must not touch Streamlit.
+def stream_into(job, model, prompt, structured, generation_config=None):
+    parser = RecipeStreamParser(structured)
+    parse_time = 0.0
+    response = model.generate_content(prompt, generation_config=generation_config, stream=True)
+    for text in iter_stream_text(response):
+        if job.cancelled:
+            return
+        started = time.perf_counter()
+        recipes = parser.feed(text)
+        parse_time += time.perf_counter() - started
+        for recipe in recipes:
+            job.add_recipe(recipe)
+        job.preview = parser.preview
+    started = time.perf_counter()
+    recipes = parser.close()
+    observe("parse_seconds", parse_time + time.perf_counter() - started, mode="stream")
+    # Usage and finish reason are only known once the last chunk has been read
+    if hit_token_limit(response):
+        recipes = []
+        job.notes.append(TRUNCATED_NOTE)
+    for recipe in recipes:
+        job.add_recipe(recipe)
+    job.preview = ""
+
+
+def fan_out_into(job, model, prompt, count, generation_config=None, timeout=45, format_error=str):
+    """One single-recipe request per slot, each steered by a diversity hint."""
+    prompts = [with_diversity_hint(prompt, i) for i in range(count)]
+
+    def generate(p):
+        response = model.generate_content(p, generation_config=generation_config, request_options={"timeout": timeout})
+        with span("parse_seconds", mode="parallel"):
+            return complete_recipes(response)
+
+    for i, result, error in generate_concurrently(generate, prompts, timeout=timeout):
+        if job.cancelled:
+            return
+        if error is not None:
+            job.notes.append(f"Recipe {i + 1} couldn't be generated: {format_error(error)}")
+            continue
+        recipes, truncated = result
+        if not recipes:
+            reason = "it was cut off at the output-token limit" if truncated else "the response contained no recipe"
+            job.notes.append(f"Recipe {i + 1} couldn't be generated: {reason}")
+            continue
+        job.add_recipe(recipes[0])
+
+
+def generate_into(job, model, prompt, generation_config=None):
+    response = model.generate_content(prompt, generation_config=generation_config)
+    if job.cancelled:
+        return
+    with span("parse_seconds", mode="single"):
+        recipes, truncated = complete_recipes(response)
+    if truncated:
+        job.notes.append(TRUNCATED_NOTE)
+    for recipe in recipes:
+        job.add_recipe(recipe)
+
+
+def repair_into(job, model, prompt, generation_config=None, attempts=2, timeout=45, format_error=str):
+    """Regenerate only the recipes the job's validator rejected.
+
+    ``prompt`` must ask for a single recipe.  Each rejected recipe gets up to
+    ``attempts`` replacements, told exactly which ingredients to leave out;
+    if none passes the recipe is dropped with a note.
+    """
+    rejected, job.rejected = job.rejected, []
+
+    def replace(item):
+        recipe, violations = item
+        avoid = ", ".join(sorted(set(violations) | set(violations.values())))
+        for attempt in range(attempts):
+            if job.cancelled:
+                return None
+            response = model.generate_content(
+                with_diversity_hint(prompt, attempt) + f"\nThe recipe must not contain any of these, not even as a garnish or optional extra: {avoid}.",
+                generation_config=generation_config,
+                request_options={"timeout": timeout},
+            )
+            for candidate in complete_recipes(response)[0][:1]:
+                if not job.validator.violations(candidate):
+                    return candidate
+        return None
+
+    for i, result, error in generate_concurrently(replace, rejected, timeout=timeout * attempts):
+        recipe, violations = rejected[i]
+        if result is not None:
+            job.add_recipe(result)
+        elif not job.cancelled:
+            reason = format_error(error) if error is not None else "no safe replacement was found"
+            job.notes.append(f"Removed \"{recipe.title}\" because it used {describe(violations)}; {reason}.")
+
+
+def generate_recipes(model, prompt, count, structured, mode="single", generation_config=None, timeout=45,
+                     format_error=str, validator=None, repair_prompt=None):
+    """Run one generation to completion on the calling thread.
+
+    ``mode`` is ``"single"``, ``"stream"`` or ``"parallel"``; for the
+    parallel fan-out ``prompt`` must ask for a single recipe.  With a
+    ``validator``, recipes using avoided ingredients are regenerated from
+    the single-recipe ``repair_prompt``.  Returns ``(recipes, notes)`` where
+    notes describe slots that failed or were removed.
+    """
+    job = Job()
+    job.validator = validator
+    if mode == "parallel" and count > 1:
+        fan_out_into(job, model, prompt, count, generation_config, timeout, format_error)
+    elif mode == "stream":
+        stream_into(job, model, prompt, structured, generation_config)
+    else:
+        generate_into(job, model, prompt, generation_config)
+    if job.rejected:
+        repair_into(job, model, repair_prompt or prompt, generation_config, timeout=timeout, format_error=format_error)
+    return job.recipes, job.notes
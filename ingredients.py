@@ -0,0 +1,193 @@
+"""Ingredient vocabulary: canonical names, type-ahead search and normalization.
+
+The vocabulary is a CSV of canonical ingredients, each with a category and
+``|``-separated synonyms (``ingredients.csv`` next to this file, or the
+file named by ``FRIDGEFEAST_INGREDIENTS``).  :func:`fold_ingredient` maps
+any spelling of an ingredient (case, plurals, "aubergine") to one
+canonical key; the similarity index, library matcher, allergen checks and
+history rollups all compare on it.  Names outside the vocabulary are
+still lowercased and singularized, so folding never fails.
+
+Type-ahead search runs over a sorted list of every name and synonym plus
+each of their inner words ("pepper" finds "bell pepper"), so a prefix is
+found with one ``bisect`` however large the vocabulary grows.  The file is
+loaded and indexed once per process by :func:`load_vocabulary`.
+"""
+
+import bisect
+import csv
+import os
+from functools import lru_cache
+
+
+DEFAULT_VOCABULARY_PATH = os.environ.get(
+    "FRIDGEFEAST_INGREDIENTS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingredients.csv"),
+)
+SEARCH_LIMIT = 10
+
+_IRREGULAR_PLURALS = {
+    "leaves": "leaf",
+    "halves": "half",
+    "loaves": "loaf",
+    "knives": "knife",
+}
+
+# Words that end in "s" without being plurals
+_SINGULAR_S = {"molasses", "swiss", "hummus", "couscous", "asparagus", "citrus", "lettuce", "brussels"}
+
+# Plurals in "-ies" whose singular ends in "-ie" rather than "-y"
+_IE_SINGULARS = {"cookie", "brownie", "smoothie", "veggie", "calorie", "goodie", "toastie", "sweetie", "foodie"}
+
+
+def singularize(word):
+    if word in _IRREGULAR_PLURALS:
+        return _IRREGULAR_PLURALS[word]
+    if word in _SINGULAR_S or len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        # "pies", "ties": too short for the "-y" rule
+        if word[:-1] in _IE_SINGULARS or len(word) <= 4:
+            return word[:-1]
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def _clean(name):
+    return " ".join(name.lower().split())
+
+
+def fold_words(name):
+    """Lowercase, whitespace-collapsed and singular, without consulting the vocabulary."""
+    words = _clean(name).split()
+    if not words:
+        return ""
+    words[-1] = singularize(words[-1])
+    return " ".join(words)
+
+
+class Vocabulary:
+    """Canonical ingredients with a synonym table and a sorted prefix index."""
+
+    def __init__(self, rows):
+        # Canonical key (the folded name) -> {"name", "category", "synonyms"}
+        self.entries = {}
+        # Folded name or synonym -> canonical key
+        self._aliases = {}
+        synonyms = []
+        for row in rows:
+            name = _clean(row.get("name") or "")
+            key = fold_words(name)
+            if not key or key in self.entries:
+                continue
+            names = [s for s in (_clean(s) for s in (row.get("synonyms") or "").split("|")) if s]
+            self.entries[key] = {"name": name, "category": (row.get("category") or "").strip() or "Other", "synonyms": names}
+            for alias in {name, key}:
+                self._aliases.setdefault(alias, key)
+            synonyms += [(synonym, key) for synonym in names]
+        # Synonyms never shadow a canonical name
+        for synonym, key in synonyms:
+            self._aliases.setdefault(synonym, key)
+            self._aliases.setdefault(fold_words(synonym), key)
+
+        # (term, rank, key): rank 0 is a whole canonical name, 1 a whole synonym, 2 an inner word
+        terms = set()
+        for alias, key in self._aliases.items():
+            terms.add((alias, 0 if alias in (key, self.entries[key]["name"]) else 1, key))
+            words = alias.split()
+            for i in range(1, len(words)):
+                terms.add((" ".join(words[i:]), 2, key))
+        self._terms = sorted(terms)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return self.key(name) is not None
+
+    def key(self, name):
+        """Canonical key for ``name``, or ``None`` if it isn't in the vocabulary."""
+        cleaned = _clean(name)
+        return self._aliases.get(cleaned) or self._aliases.get(fold_words(cleaned))
+
+    def fold(self, name):
+        cleaned = _clean(name)
+        key = self._aliases.get(cleaned)
+        if key is None:
+            folded = fold_words(cleaned)
+            key = self._aliases.get(folded, folded)
+        return key
+
+    def canonical(self, name):
+        """Display name of the canonical ingredient for ``name``, or ``None``."""
+        key = self.key(name)
+        return self.entries[key]["name"] if key is not None else None
+
+    def normalize(self, name):
+        """The canonical name when known, otherwise ``name`` with its whitespace tidied."""
+        return self.canonical(name) or " ".join(name.split())
+
+    def category(self, name):
+        key = self.key(name)
+        return self.entries[key]["category"] if key is not None else None
+
+    def _matches(self, prefix, best):
+        start = bisect.bisect_left(self._terms, (prefix,))
+        end = bisect.bisect_left(self._terms, (prefix + "\uffff",), start)
+        for term, rank, key in self._terms[start:end]:
+            # Typing a whole name or synonym puts it first; a whole inner word doesn't count
+            exact = term == prefix and rank < 2
+            score = (0 if exact else rank + 1, len(self.entries[key]["name"]))
+            if key not in best or score < best[key]:
+                best[key] = score
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Canonical names matching a typed prefix, best first.
+
+        Whole-name matches rank above synonyms, which rank above matches on
+        an inner word; shorter names win ties.
+        """
+        prefix = _clean(query)
+        if not prefix:
+            return []
+        best = {}
+        self._matches(prefix, best)
+        # "tomatoes" should find what "tomato" does
+        folded = fold_words(prefix)
+        if folded != prefix:
+            self._matches(folded, best)
+        keys = sorted(best, key=lambda k: (best[k], self.entries[k]["name"]))
+        return [self.entries[k]["name"] for k in keys[:limit]]
+
+
+@lru_cache(maxsize=None)
+def load_vocabulary(path=DEFAULT_VOCABULARY_PATH):
+    """The vocabulary at ``path``, parsed and indexed once per process."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return Vocabulary(csv.DictReader(f))
+
+
+def fold_ingredient(name):
+    """Canonical name for an ingredient: lowercase, singular, synonyms merged."""
+    return load_vocabulary().fold(name)
+
+
+def ingredient_set(items):
+    """Folded set of a comma string or list of ingredients."""
+    if isinstance(items, str):
+        items = items.split(",")
+    return frozenset(f for f in (fold_ingredient(i) for i in items if i) if f)
+
+
+def canonical_ingredients(items):
+    """Ingredient names as the app sends them to Gemini: canonical where known, deduplicated in order.
+
+    Cache keys are built from this list, so anything that fills the cache
+    (the app, batch runs) must normalize through here to share entries.
+    """
+    vocabulary = load_vocabulary()
+    return list(dict.fromkeys(vocabulary.normalize(i) for i in items if i and i.strip()))
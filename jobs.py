@@ -0,0 +1,146 @@
+"""Background generation jobs.
+
+Generations run on a process-wide worker pool instead of the Streamlit
+script thread, so widget interaction never aborts a request.  Sessions keep
+only a job id and poll for progress; the pool size caps how many Gemini
+calls run at once across every user of the process.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import observe
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = {DONE, FAILED, CANCELLED}
+
+
+class Job:
+    """State of one generation, shared between a worker and polling sessions."""
+
+    def __init__(self, key=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = QUEUED
+        self.recipes = []
+        self.notes = []
+        self.preview = ""
+        self.error = None
+        # Optional allergens.AvoidListValidator; recipes it flags wait in ``rejected``
+        self.validator = None
+        self.rejected = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Sessions sharing this job; it is only cancelled once all of them give up
+        self.watchers = 1
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def cancel(self):
+        self._cancel.set()
+
+    def add_recipe(self, recipe):
+        violations = self.validator.violations(recipe) if self.validator else None
+        with self._lock:
+            if violations:
+                self.rejected.append((recipe, violations))
+            elif all(r.id != recipe.id for r in self.recipes):
+                self.recipes.append(recipe)
+
+    def snapshot(self):
+        """Consistent copy of the progress for rendering."""
+        with self._lock:
+            return list(self.recipes), list(self.notes), self.preview
+
+
+class JobManager:
+    """Bounded worker pool with de-duplication of identical in-flight jobs."""
+
+    def __init__(self, max_workers=4, retention_seconds=600):
+        self.retention_seconds = retention_seconds
+        self._jobs = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation")
+
+    def submit(self, fn, key=None):
+        """Schedule ``fn(job)`` and return the job id.
+
+        If a job with the same ``key`` is still queued or running, its id is
+        returned instead of starting a duplicate request.
+        """
+        with self._lock:
+            self._prune()
+            # A cancelled job is still winding down and won't produce recipes, so it is never joined
+            job = self._jobs.get(self._inflight.get(key)) if key is not None else None
+            if job is not None and not job.cancelled:
+                job.watchers += 1
+                return job.id
+            job = Job(key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._inflight[key] = job.id
+        self._executor.submit(self._run, job, fn)
+        return job.id
+
+    def _run(self, job, fn):
+        status = CANCELLED
+        try:
+            if not job.cancelled:
+                job.status = RUNNING
+                job.started_at = time.time()
+                fn(job)
+                status = CANCELLED if job.cancelled else DONE
+        except Exception as e:
+            job.error = e
+            status = FAILED
+        finally:
+            job.finished_at = time.time()
+            if job.started_at:
+                observe("job_queue_seconds", job.started_at - job.created_at)
+                observe("job_seconds", job.finished_at - job.started_at, status=status)
+            with self._lock:
+                if job.key is not None and self._inflight.get(job.key) == job.id:
+                    del self._inflight[job.key]
+            job.status = status
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.watchers -= 1
+            if job.watchers <= 0:
+                job.cancel()
+                if self._inflight.get(job.key) == job.id:
+                    del self._inflight[job.key]
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self._jobs[job_id]
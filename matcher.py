@@ -0,0 +1,194 @@
+"""Rank a user's saved and past recipes against what is in the fridge.
+
+Each library is a sparse recipe x ingredient matrix kept as COO arrays
+(``rows``, ``cols``) over a growing ingredient vocabulary.  Scoring a fridge
+marks the vocabulary columns it covers or forbids, then counts hits per
+recipe with ``np.bincount`` — one vectorized pass over every non-zero, no
+per-recipe Python loop.  New recipes are appended in place, so saving a
+favorite or finishing a generation never rebuilds the matrix.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from ingredients import fold_ingredient
+
+
+# Assumed to be in every kitchen, so never counted as missing
+PANTRY_STAPLES = {"salt", "black pepper", "pepper", "water", "oil", "cooking oil", "vegetable oil", "ice"}
+
+# Leading amount on a markdown bullet ("2 1/2 cups of", "200g", "a pinch of"), which
+# structured recipes keep in a separate quantity field
+_UNITS = (r"cups?|tbsps?|tablespoons?|tsps?|teaspoons?|g|grams?|kg|kilograms?|mg|ml|millilit(?:er|re)s?|l|lit(?:er|re)s?"
+          r"|oz|ounces?|lbs?|pounds?|cloves?|cans?|tins?|jars?|packets?|packs?|pinch(?:es)?|dash(?:es)?|handfuls?"
+          r"|slices?|pieces?|bunch(?:es)?|sprigs?|stalks?|sticks?|heads?|knobs?|drizzle|splash")
+_AMOUNT = re.compile(
+    r"^(?:(?:(?:about|approx|a|an)\b\.?|[\d\u00bc-\u00be\u2150-\u215e]+(?:[./]\d+)?)(?:\s*(?:-|to)\s*[\d./]+)?\s*)+"
+    r"(?:\(.*?\)\s*)?"
+    rf"(?:(?:{_UNITS})\b\.?\s*)?(?:(?:large|medium|small)\b\s*)?(?:of\s+)?",
+    re.IGNORECASE,
+)
+
+
+def recipe_ingredient_names(recipe):
+    """Folded ingredient names, read from markdown bullets for free-form recipes."""
+    if recipe.ingredients:
+        names = [i.name for i in recipe.ingredients]
+    else:
+        names = []
+        in_ingredients = False
+        for line in recipe.markdown.splitlines():
+            stripped = line.strip()
+            if stripped.startswith("#"):
+                in_ingredients = "ingredient" in stripped.lower()
+            elif in_ingredients and stripped[:2] in ("- ", "* "):
+                names.append(_AMOUNT.sub("", stripped[2:].split(",")[0]))
+    return {f for f in (fold_ingredient(n) for n in names) if f and f not in PANTRY_STAPLES}
+
+
+class RecipeMatcher:
+    """Incrementally built sparse ingredient matrix for one library."""
+
+    def __init__(self):
+        self.recipes = []
+        self._row_of = {}
+        self._vocab = {}
+        self._names = []
+        # Word -> vocabulary columns containing it, so "chicken" covers "chicken thigh"
+        self._columns_by_word = {}
+        self._rows = np.empty(256, dtype=np.int32)
+        self._cols = np.empty(256, dtype=np.int32)
+        self._nnz = 0
+        self._sizes = np.empty(64, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def _column(self, name):
+        col = self._vocab.get(name)
+        if col is None:
+            col = self._vocab[name] = len(self._names)
+            self._names.append(name)
+            for word in name.split():
+                self._columns_by_word.setdefault(word, set()).add(col)
+        return col
+
+    def add(self, recipe):
+        if recipe.id in self._row_of:
+            return
+        cols = sorted({self._column(name) for name in recipe_ingredient_names(recipe)})
+        if not cols:
+            return
+        row = len(self.recipes)
+        self._row_of[recipe.id] = row
+        self.recipes.append(recipe)
+
+        end = self._nnz + len(cols)
+        if end > len(self._rows):
+            capacity = max(end, 2 * len(self._rows))
+            self._rows = np.resize(self._rows, capacity)
+            self._cols = np.resize(self._cols, capacity)
+        self._rows[self._nnz:end] = row
+        self._cols[self._nnz:end] = cols
+        self._nnz = end
+        if row >= len(self._sizes):
+            self._sizes = np.resize(self._sizes, 2 * len(self._sizes))
+        self._sizes[row] = len(cols)
+
+    def _columns_for(self, items):
+        """Vocabulary columns matched by any of the given ingredients."""
+        matched = set()
+        for item in items:
+            words = fold_ingredient(item).split()
+            if not words:
+                continue
+            cols = set(self._columns_by_word.get(words[0], ()))
+            for word in words[1:]:
+                cols &= self._columns_by_word.get(word, set())
+            matched |= cols
+        return np.fromiter(matched, dtype=np.int32, count=len(matched))
+
+    def rank(self, available, avoid=(), limit=5):
+        """Best library recipes for ``available`` ingredients, skipping any that use ``avoid``.
+
+        Returns dicts with the recipe, ``coverage`` (share of its ingredients
+        on hand), ``missing`` ingredient names and ``used`` count.
+        """
+        if not self.recipes or not available:
+            return []
+        rows = self._rows[:self._nnz]
+        cols = self._cols[:self._nnz]
+        n = len(self.recipes)
+
+        have = np.isin(cols, self._columns_for(available))
+        used = np.bincount(rows, weights=have, minlength=n)
+        violations = np.bincount(rows, weights=np.isin(cols, self._columns_for(avoid)), minlength=n)
+
+        sizes = self._sizes[:n]
+        missing = sizes - used
+        coverage = used / sizes
+        score = coverage - 0.05 * missing
+        score[(violations > 0) | (used == 0)] = -np.inf
+
+        top = np.argsort(-score, kind="stable")[:limit]
+        top = top[np.isfinite(score[top])]
+
+        matches = []
+        for row in top:
+            missing_cols = cols[(rows == row) & ~have]
+            matches.append({
+                "recipe": self.recipes[row],
+                "coverage": float(coverage[row]),
+                "used": int(used[row]),
+                "missing": [self._names[c] for c in missing_cols],
+            })
+        return matches
+
+
+class LibraryIndex:
+    """Per-user matchers, built lazily from a loader and then kept up to date.
+
+    Only the ``max_users`` most recently used libraries are kept; an evicted
+    one is rebuilt from the loader the next time it is ranked.
+    """
+
+    def __init__(self, load_recipes, max_users=64):
+        self._load_recipes = load_recipes
+        self.max_users = max_users
+        self._matchers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _matcher(self, user_id):
+        matcher = self._matchers.get(user_id)
+        if matcher is None:
+            matcher = RecipeMatcher()
+            for recipe in self._load_recipes(user_id):
+                matcher.add(recipe)
+            self._matchers[user_id] = matcher
+            while len(self._matchers) > self.max_users:
+                self._matchers.popitem(last=False)
+        self._matchers.move_to_end(user_id)
+        return matcher
+
+    def add(self, user_id, recipes):
+        with self._lock:
+            # Unbuilt libraries pick new recipes up from storage when first ranked
+            if user_id in self._matchers:
+                for recipe in recipes:
+                    self._matchers[user_id].add(recipe)
+
+    def reset(self, user_id, recipes=None):
+        """Drop a library after deletes; ``recipes`` seeds it directly (e.g. after an import)."""
+        with self._lock:
+            self._matchers.pop(user_id, None)
+            if recipes is not None:
+                matcher = self._matchers[user_id] = RecipeMatcher()
+                for recipe in recipes:
+                    matcher.add(recipe)
+
+    def rank(self, user_id, available, avoid=(), limit=5):
+        with self._lock:
+            return self._matcher(user_id).rank(available, avoid, limit)
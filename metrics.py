@@ -0,0 +1,222 @@
+"""In-process metrics for the hot paths.
+
+Timing spans feed latency histograms; counters track tokens, retries, cache
+lookups and errors.  Everything lives in one process-wide registry that the
+Settings tab renders and that can be exported as Prometheus text or JSON
+(optionally served over HTTP by setting ``FRIDGEFEAST_METRICS_PORT``).
+"""
+
+import bisect
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Upper bounds in seconds for the Prometheus buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Percentiles are computed over this many most recent observations per series
+WINDOW = 2048
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=WINDOW)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def summary(self):
+        recent = list(self.recent)
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": percentile(recent, 0.50),
+            "p95": percentile(recent, 0.95),
+            "p99": percentile(recent, 0.99),
+        }
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _labels_key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _labels_key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name, fn, help=""):
+        """Register a callable sampled at export time (e.g. cache size)."""
+        with self._lock:
+            self._gauges[name] = fn
+            if help:
+                self._help[name] = help
+
+    def describe(self, name, help):
+        self._help[name] = help
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Time the block into the ``name`` histogram, in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name, **labels):
+        """Decorator form of :meth:`span`."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {
+                name: [dict(labels=dict(key), **h.summary()) for key, h in series.items()]
+                for name, series in self._histograms.items()
+            }
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            gauges = dict(self._gauges)
+        sampled = {}
+        for name, fn in gauges.items():
+            try:
+                sampled[name] = fn()
+            except Exception:
+                # A gauge whose source is gone shouldn't break the export
+                continue
+        return {"histograms": histograms, "counters": counters, "gauges": sampled}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            histograms = {name: {k: (list(h.counts), h.count, h.sum) for k, h in series.items()} for name, series in self._histograms.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            gauges = dict(self._gauges)
+
+        for name, series in sorted(histograms.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, (counts, count, total) in series.items():
+                cumulative = 0
+                for bound, n in zip(BUCKETS, counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        for name, series in sorted(counters.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for name, fn in sorted(gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+METRICS = Registry()
+span = METRICS.span
+timed = METRICS.timed
+observe = METRICS.observe
+inc = METRICS.inc
+
+
+def record_usage(response, model=""):
+    """Add a response's ``usage_metadata`` token counts to the token counters."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, field in (("prompt", "prompt_token_count"), ("output", "candidates_token_count"), ("total", "total_token_count")):
+        count = getattr(usage, field, 0) or 0
+        if count:
+            inc("gemini_tokens_total", count, kind=kind, model=model)
+
+
+def serve_prometheus(port, registry=METRICS):
+    """Serve ``/metrics`` in Prometheus text format on a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    return server
@@ -0,0 +1,138 @@
+"""Local stand-in for ``genai.GenerativeModel`` used by benchmarks and offline runs.
+
+``MockGenerativeModel.generate_content`` answers with deterministic recipes
+built from the ingredients named in the prompt, as JSON when the generation
+config asks for it and ``---`` separated markdown otherwise.  Latency,
+streaming chunk size and error injection are configurable, either in the
+constructor or through ``FRIDGEFEAST_MOCK_*`` environment variables when the
+app runs with ``FRIDGEFEAST_BACKEND=mock``.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+from google.api_core import exceptions as api_exceptions
+
+from recipes import RECIPE_SEPARATOR, Recipe, to_markdown
+
+
+ADJECTIVES = ["Golden", "Zesty", "Rustic", "Smoky", "Herby", "Crispy", "Silky", "Fiery", "Sunny", "Cozy"]
+DISHES = ["Skillet", "Bowl", "Traybake", "Stir-Fry", "Stew", "Salad", "Pasta", "Tacos", "Frittata", "Curry"]
+EXTRAS = ["olive oil", "garlic", "onion", "salt", "black pepper", "lemon", "fresh herbs", "chili flakes"]
+QUANTITIES = ["1 cup", "2 tbsp", "200 g", "1 tsp", "2", "a handful of", "3 cloves", "400 ml"]
+
+
+def fake_recipe(rng, ingredients):
+    """A plausible recipe dict using ``ingredients``, drawn from ``rng``."""
+    main = ingredients[0] if ingredients else rng.choice(EXTRAS)
+    used = list(dict.fromkeys(ingredients + rng.sample(EXTRAS, 3)))
+    return {
+        "title": f"{rng.choice(ADJECTIVES)} {main.title()} {rng.choice(DISHES)} #{rng.randrange(10000)}",
+        "description": f"A simple {main} dish that comes together with pantry staples. Bright, balanced and quick.",
+        "ingredients": [{"name": name, "quantity": rng.choice(QUANTITIES)} for name in used],
+        "steps": [
+            f"Prepare the {', '.join(used[:3])}.",
+            "Heat a large pan over medium-high heat and add a splash of oil.",
+            f"Cook the {main} until golden, about {rng.randint(4, 12)} minutes.",
+            "Add the remaining ingredients and simmer until everything is tender.",
+            "Season to taste and serve warm.",
+        ],
+        "time": f"{rng.choice([15, 20, 30, 45])} minutes",
+        "difficulty": rng.choice(["Easy", "Medium"]),
+        "calories": f"{rng.randint(250, 750)} kcal",
+        "servings": str(rng.choice([2, 4])),
+    }
+
+
+class _Usage:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = len(prompt) // 4
+        self.candidates_token_count = len(text) // 4
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class MockResponse:
+    def __init__(self, prompt, text):
+        self.text = text
+        self.usage_metadata = _Usage(prompt, text)
+
+
+class MockStreamResponse:
+    """Iterates the text in chunks, sleeping ``chunk_delay`` between them."""
+
+    def __init__(self, prompt, text, chunk_size, chunk_delay):
+        self._chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self._chunk_delay = chunk_delay
+        self.usage_metadata = _Usage(prompt, text)
+
+    def __iter__(self):
+        for i, chunk in enumerate(self._chunks):
+            if i and self._chunk_delay:
+                time.sleep(self._chunk_delay)
+            yield _Chunk(chunk)
+
+
+class MockGenerativeModel:
+    """Drop-in for ``generate_content`` with tunable latency and failures.
+
+    ``latency`` is the delay before a response (or the first chunk of a
+    stream); ``error_rate`` is the chance a call raises one of ``errors``.
+    """
+
+    def __init__(self, model_name="mock", latency=0.0, chunk_size=64, chunk_delay=0.0,
+                 error_rate=0.0, errors=(api_exceptions.ServiceUnavailable, api_exceptions.ResourceExhausted), seed=0):
+        self.model_name = model_name
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.errors = errors
+        self.seed = seed
+        self.calls = 0
+        self._failures = random.Random(seed)
+
+    @classmethod
+    def from_env(cls, model_name="mock"):
+        return cls(
+            model_name,
+            latency=float(os.environ.get("FRIDGEFEAST_MOCK_LATENCY", 0.5)),
+            chunk_size=int(os.environ.get("FRIDGEFEAST_MOCK_CHUNK_SIZE", 64)),
+            chunk_delay=float(os.environ.get("FRIDGEFEAST_MOCK_CHUNK_DELAY", 0.02)),
+            error_rate=float(os.environ.get("FRIDGEFEAST_MOCK_ERROR_RATE", 0)),
+            seed=int(os.environ.get("FRIDGEFEAST_MOCK_SEED", 0)),
+        )
+
+    def respond(self, prompt, structured):
+        """The deterministic response text for ``prompt``."""
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).digest()
+        rng = random.Random(digest)
+        match = re.search(r"Create (\d+) unique", prompt)
+        count = int(match.group(1)) if match else 1
+        match = re.search(r"following ingredients: (.*?)\.\n", prompt)
+        ingredients = [i.strip() for i in match.group(1).split(",") if i.strip()] if match else []
+        recipes = [fake_recipe(rng, ingredients) for _ in range(count)]
+        if structured:
+            return json.dumps(recipes)
+        return f"\n\n{RECIPE_SEPARATOR}\n\n".join(to_markdown(Recipe.from_dict(r)) for r in recipes)
+
+    def generate_content(self, contents, generation_config=None, stream=False, request_options=None, **kwargs):
+        self.calls += 1
+        prompt = contents if isinstance(contents, str) else str(contents)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._failures.random() < self.error_rate:
+            raise self._failures.choice(self.errors)("Injected mock failure")
+        structured = bool(generation_config and generation_config.get("response_mime_type") == "application/json")
+        text = self.respond(prompt, structured)
+        if stream:
+            return MockStreamResponse(prompt, text, self.chunk_size, self.chunk_delay)
+        return MockResponse(prompt, text)
@@ -0,0 +1,281 @@
+"""Compact recipe model shared by results, favorites, history and exports."""
+
+import hashlib
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+# Gemini structured-output schema for a list of recipes
+RECIPE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "title": {"type": "STRING"},
+        "description": {"type": "STRING"},
+        "ingredients": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "name": {"type": "STRING"},
+                    "quantity": {"type": "STRING"},
+                },
+                "required": ["name", "quantity"],
+            },
+        },
+        "steps": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "time": {"type": "STRING"},
+        "difficulty": {"type": "STRING"},
+        "calories": {"type": "STRING"},
+        "servings": {"type": "STRING"},
+    },
+    "required": ["title", "description", "ingredients", "steps", "time", "difficulty", "calories", "servings"],
+}
+
+RECIPE_LIST_SCHEMA = {"type": "ARRAY", "items": RECIPE_SCHEMA}
+
+RECIPE_SEPARATOR = "---"
+
+
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+
+@dataclass(frozen=True, slots=True)
+class Ingredient:
+    name: str
+    quantity: str = ""
+
+    @classmethod
+    def from_value(cls, value):
+        if isinstance(value, dict):
+            name = _text(value.get("name"))
+            if not name:
+                raise ValueError("Ingredient is missing a name")
+            return cls(name, _text(value.get("quantity")))
+        if isinstance(value, str) and value.strip():
+            return cls(value.strip())
+        raise ValueError(f"Invalid ingredient: {value!r}")
+
+
+@dataclass(frozen=True, slots=True)
+class Recipe:
+    title: str
+    description: str = ""
+    ingredients: tuple = ()
+    steps: tuple = ()
+    time: str = ""
+    difficulty: str = ""
+    calories: str = ""
+    servings: str = ""
+    # Free-form body for recipes that did not come from structured output
+    markdown: str = ""
+
+    @property
+    def id(self):
+        return recipe_id(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Validate a decoded JSON object into a :class:`Recipe`."""
+        if not isinstance(data, dict):
+            raise ValueError("Recipe must be a JSON object")
+        title = _text(data.get("title"))
+        markdown = _text(data.get("markdown"))
+        if not title and not markdown:
+            raise ValueError("Recipe is missing a title")
+        ingredients = data.get("ingredients") or ()
+        steps = data.get("steps") or ()
+        if not isinstance(ingredients, (list, tuple)) or not isinstance(steps, (list, tuple)):
+            raise ValueError("Recipe ingredients and steps must be lists")
+        return cls(
+            title=title or _markdown_title(markdown),
+            description=_text(data.get("description")),
+            ingredients=tuple(Ingredient.from_value(i) for i in ingredients),
+            steps=tuple(_text(s) for s in steps if _text(s)),
+            time=_text(data.get("time")),
+            difficulty=_text(data.get("difficulty")),
+            calories=_text(data.get("calories")),
+            servings=_text(data.get("servings")),
+            markdown=markdown,
+        )
+
+    @classmethod
+    def from_markdown(cls, text):
+        markdown = text.strip()
+        return cls(title=_markdown_title(markdown), markdown=markdown)
+
+    def to_dict(self):
+        data = {
+            "title": self.title,
+            "description": self.description,
+            "ingredients": [{"name": i.name, "quantity": i.quantity} for i in self.ingredients],
+            "steps": list(self.steps),
+            "time": self.time,
+            "difficulty": self.difficulty,
+            "calories": self.calories,
+            "servings": self.servings,
+        }
+        if self.markdown:
+            data["markdown"] = self.markdown
+        return data
+
+
+def search_text(recipe):
+    """Plain text body indexed for full-text search."""
+    parts = [recipe.description]
+    parts += [f"{i.quantity} {i.name}".strip() for i in recipe.ingredients]
+    parts += list(recipe.steps)
+    parts.append(recipe.markdown)
+    return "\n".join(p for p in parts if p)
+
+
+def _markdown_title(markdown):
+    title = markdown.split("\n")[0].replace("#", "").strip() if markdown else ""
+    return title or "Recipe"
+
+
+@lru_cache(maxsize=4096)
+def recipe_id(recipe):
+    """Short content hash identifying a recipe across sessions."""
+    payload = json.dumps(recipe.to_dict(), sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+@lru_cache(maxsize=1024)
+def to_markdown(recipe):
+    """Render a recipe for display; only called at render time and cached."""
+    if recipe.markdown:
+        return recipe.markdown
+
+    lines = [f"## {recipe.title}"]
+    if recipe.description:
+        lines += ["", f"*{recipe.description}*"]
+
+    facts = [
+        f"**{label}:** {value}"
+        for label, value in (
+            ("⏱️ Time", recipe.time),
+            ("📊 Difficulty", recipe.difficulty),
+            ("🔥 Calories", recipe.calories),
+            ("🍽️ Servings", recipe.servings),
+        )
+        if value
+    ]
+    if facts:
+        lines += ["", " | ".join(facts)]
+
+    if recipe.ingredients:
+        lines += ["", "### Ingredients"]
+        lines += [f"- {i.quantity} {i.name}" if i.quantity else f"- {i.name}" for i in recipe.ingredients]
+
+    if recipe.steps:
+        lines += ["", "### Instructions"]
+        lines += [f"{n}. {step}" for n, step in enumerate(recipe.steps, 1)]
+
+    return "\n".join(lines)
+
+
+def _complete_objects(text):
+    """The objects of a JSON array cut off part way, up to the last one that was closed."""
+    decoder = json.JSONDecoder()
+    objects, pos = [], text.index("[") + 1
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if not text.startswith("{", pos):
+            return objects
+        try:
+            item, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            return objects
+        objects.append(item)
+
+
+def parse_recipes(text):
+    """Validate a response into recipes: a JSON list/object, else ``---`` separated markdown.
+
+    JSON cut off part way (a token limit, say) keeps only its complete
+    recipes; it is never read as markdown.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+        stripped = text.lstrip()
+        if stripped.startswith("["):
+            data = _complete_objects(stripped)
+        elif stripped.startswith("{"):
+            raise ValueError("The response ended before the recipe was complete")
+
+    if isinstance(data, dict):
+        data = [data]
+    if isinstance(data, list):
+        recipes = [Recipe.from_dict(item) for item in data]
+    else:
+        recipes = [Recipe.from_markdown(part) for part in text.split(RECIPE_SEPARATOR) if part.strip()]
+    return unique_recipes(recipes)
+
+
+def unique_recipes(recipes):
+    return list({recipe.id: recipe for recipe in recipes}.values())
+
+
+def dump_recipes(recipes):
+    return json.dumps([recipe.to_dict() for recipe in recipes])
+
+
+def favorite_from_dict(data, recipes=None):
+    """Load a favorite from export JSON.
+
+    Current exports reference a shared ``recipes`` map by id; older ones
+    carry the recipe inline (``recipe``) or as markdown (``content``).
+    """
+    if "recipe" in data:
+        recipe = Recipe.from_dict(data["recipe"])
+    elif "content" in data:
+        recipe = Recipe.from_markdown(data["content"])
+    else:
+        recipe = Recipe.from_dict((recipes or {})[data["id"]])
+    return {
+        "recipe": recipe,
+        "ingredients": data.get("ingredients", ""),
+        "date_saved": data.get("date_saved", ""),
+    }
+
+
+def favorite_to_dict(favorite):
+    return {
+        "id": favorite["id"],
+        "ingredients": favorite["ingredients"],
+        "date_saved": favorite["date_saved"],
+    }
+
+
+def history_from_dict(data, recipes=None):
+    """Load a history entry from export JSON, accepting older inline shapes."""
+    if "recipe_ids" in data:
+        loaded = [Recipe.from_dict((recipes or {})[recipe_id]) for recipe_id in data["recipe_ids"]]
+    elif "response" in data:
+        loaded = parse_recipes(data["response"] or "")
+    else:
+        loaded = [Recipe.from_dict(r) for r in data.get("recipes", [])]
+    return {
+        "date": data.get("date", ""),
+        "ingredients": data.get("ingredients", ""),
+        "recipes": loaded,
+        "cuisine": data.get("cuisine", ""),
+        "diet": data.get("diet", ""),
+        "latency": data.get("latency"),
+    }
+
+
+def history_to_dict(entry, recipe_ids):
+    return {
+        "date": entry["date"],
+        "ingredients": entry["ingredients"],
+        "recipe_ids": recipe_ids,
+        "cuisine": entry.get("cuisine", ""),
+        "diet": entry.get("diet", ""),
+        "latency": entry.get("latency"),
+    }
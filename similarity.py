@@ -0,0 +1,155 @@
+"""Near-duplicate lookup over past generations.
+
+The exact response cache misses when two fridges differ by one staple or by
+"tomato" versus "tomatoes".  Here every cached generation is also indexed by
+its folded ingredient set: a MinHash signature split into LSH bands, with
+the bands salted by a constraint key so only requests with the same cuisine,
+meal type, diet, avoid list and count can ever collide.  A lookup is one
+indexed ``IN`` query over the band buckets followed by an exact Jaccard check
+of the few candidates it returns.
+"""
+
+import hashlib
+import json
+import random
+import time
+
+from cache import DEFAULT_CACHE_PATH, canonical_request
+from db import LocalConnection
+from ingredients import ingredient_set
+
+
+NUM_PERMUTATIONS = 32
+NUM_BANDS = 8
+ROWS_PER_BAND = NUM_PERMUTATIONS // NUM_BANDS
+DEFAULT_THRESHOLD = 0.75
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+
+def constraint_key(avoid_ingredients, cuisine, meal_type, diet, count, user_profile,
+                   advanced_options=None, model_name="", structured=False):
+    """Hash of everything in a request except the ingredients themselves."""
+    canonical = canonical_request("", sorted(ingredient_set(avoid_ingredients)), cuisine, meal_type, diet, count,
+                                  user_profile, advanced_options, model_name, structured)
+    del canonical["ingredients"]
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash(items):
+    hashes = [_hash64(item) for item in items]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_buckets(items, constraint):
+    """One signed 64-bit bucket id per LSH band, salted with the constraint key."""
+    signature = minhash(items)
+    buckets = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(f"{constraint}:{band}:{rows}".encode("utf-8"), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class SimilarityIndex:
+    """MinHash LSH index of cached generations, stored next to the response cache."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self._conn = LocalConnection(path)
+        self._init_schema()
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS similar_generations (
+                id INTEGER PRIMARY KEY,
+                cache_key TEXT NOT NULL UNIQUE,
+                ingredients TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS similar_bands (
+                bucket INTEGER NOT NULL,
+                generation_id INTEGER NOT NULL,
+                PRIMARY KEY (bucket, generation_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_similar_bands_generation ON similar_bands(generation_id);
+        """)
+
+    def add(self, cache_key, ingredients, constraint):
+        """Index the generation cached under ``cache_key``."""
+        items = ingredient_set(ingredients)
+        if not items:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._delete(conn, "cache_key = ?", (cache_key,))
+            cur = conn.execute(
+                "INSERT INTO similar_generations (cache_key, ingredients, created_at) VALUES (?, ?, ?)",
+                (cache_key, "\n".join(sorted(items)), time.time()),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO similar_bands (bucket, generation_id) VALUES (?, ?)",
+                [(bucket, cur.lastrowid) for bucket in band_buckets(items, constraint)],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def lookup(self, ingredients, constraint, threshold=DEFAULT_THRESHOLD):
+        """Return ``(score, cache_key)`` pairs at or above ``threshold``, best first."""
+        items = ingredient_set(ingredients)
+        if not items:
+            return []
+        buckets = band_buckets(items, constraint)
+        rows = self._conn().execute(
+            "SELECT g.cache_key, g.ingredients, g.created_at FROM similar_generations g "
+            "WHERE g.id IN (SELECT generation_id FROM similar_bands WHERE bucket IN (%s))"
+            % ",".join("?" * len(buckets)),
+            buckets,
+        ).fetchall()
+        matches = []
+        for cache_key, stored, created_at in rows:
+            score = jaccard(items, frozenset(stored.split("\n")))
+            if score >= threshold:
+                matches.append((score, created_at, cache_key))
+        matches.sort(reverse=True)
+        return [(score, cache_key) for score, _, cache_key in matches]
+
+    def discard(self, cache_key):
+        """Forget a generation whose cached response has been evicted."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        self._delete(conn, "cache_key = ?", (cache_key,))
+        conn.execute("COMMIT")
+
+    def _delete(self, conn, where, params):
+        ids = [row[0] for row in conn.execute(f"SELECT id FROM similar_generations WHERE {where}", params)]
+        conn.executemany("DELETE FROM similar_bands WHERE generation_id = ?", [(i,) for i in ids])
+        conn.executemany("DELETE FROM similar_generations WHERE id = ?", [(i,) for i in ids])
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM similar_generations").fetchone()[0]
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM similar_bands")
+        conn.execute("DELETE FROM similar_generations")
@@ -0,0 +1,606 @@
+"""Persistent per-user storage for favorites and recipe history.
+
+The default engine is a local SQLite file.  Views ask for exactly the rows
+they display (paged, sorted and filtered in SQL) instead of holding every
+saved recipe in session state.
+
+Recipe bodies are content-addressed: each distinct recipe is stored once,
+zlib-compressed, under its content hash (``Recipe.id``).  Favorites and
+history rows only hold references, and bodies are loaded lazily when a
+detail view or export needs them.
+"""
+
+import html
+import json
+import os
+import re
+import sqlite3
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from db import LocalConnection
+from metrics import timed
+from recipes import Recipe, search_text
+from ingredients import ingredient_set
+
+
+DEFAULT_DB_PATH = os.environ.get("FRIDGEFEAST_DB", "fridgefeast.db")
+
+SCHEMA_VERSION = 3
+
+FAVORITE_ORDERS = {
+    "Latest": "favorites.date_saved DESC, favorites.rowid DESC",
+    "Oldest": "favorites.date_saved ASC, favorites.rowid ASC",
+    "A-Z": "favorites.title COLLATE NOCASE ASC, favorites.rowid ASC",
+}
+
+# Private-use markers survive html.escape and become <mark> tags afterwards
+_HIGHLIGHT_START, _HIGHLIGHT_END = "\ue000", "\ue001"
+
+
+def fts_query(search):
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    tokens = re.findall(r"\w+", search.lower())
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def highlight(snippet):
+    return (
+        html.escape(snippet)
+        .replace(_HIGHLIGHT_START, "<mark>")
+        .replace(_HIGHLIGHT_END, "</mark>")
+    )
+
+
+def compress_recipe(recipe):
+    return zlib.compress(json.dumps(recipe.to_dict(), separators=(",", ":")).encode("utf-8"))
+
+
+def decompress_recipe(data):
+    return Recipe.from_dict(json.loads(zlib.decompress(data)))
+
+
+def _body_search_text(data):
+    # Registered as an SQL function so the FTS index can read bodies in place
+    return search_text(decompress_recipe(data)) if data is not None else ""
+
+
+def _register_functions(conn):
+    conn.create_function("body_search_text", 1, _body_search_text, deterministic=True)
+
+
+class RecipeStore:
+    """SQLite-backed favorites and history, partitioned by user id."""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._conn = LocalConnection(path, _register_functions)
+        self._init_schema()
+        self.fts = self._init_fts()
+        # Bodies are immutable, so a small per-process cache is always valid
+        self.get_recipe = lru_cache(maxsize=512)(self._get_recipe)
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _init_schema(self):
+        conn = self._conn()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        legacy = version < 2 and conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'favorites'"
+        ).fetchone()
+        if legacy:
+            conn.executescript("""
+                DROP TABLE IF EXISTS favorites_fts;
+                ALTER TABLE favorites RENAME TO favorites_v1;
+                ALTER TABLE history RENAME TO history_v1;
+                DROP INDEX IF EXISTS idx_favorites_date;
+                DROP INDEX IF EXISTS idx_favorites_title;
+                DROP INDEX IF EXISTS idx_favorites_ingredients;
+                DROP INDEX IF EXISTS idx_history_date;
+            """)
+
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS bodies (
+                hash TEXT PRIMARY KEY,
+                data BLOB NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS favorites (
+                rowid INTEGER PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                recipe_id TEXT NOT NULL REFERENCES bodies(hash),
+                title TEXT NOT NULL,
+                ingredients TEXT NOT NULL DEFAULT '',
+                date_saved TEXT NOT NULL,
+                UNIQUE (user_id, recipe_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_favorites_date ON favorites(user_id, date_saved);
+            CREATE INDEX IF NOT EXISTS idx_favorites_title ON favorites(user_id, title COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS idx_favorites_ingredients ON favorites(user_id, ingredients);
+            CREATE INDEX IF NOT EXISTS idx_favorites_recipe ON favorites(recipe_id);
+
+            CREATE TABLE IF NOT EXISTS history (
+                rowid INTEGER PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                ingredients TEXT NOT NULL DEFAULT '',
+                recipe_count INTEGER NOT NULL DEFAULT 0,
+                cuisine TEXT NOT NULL DEFAULT '',
+                diet TEXT NOT NULL DEFAULT '',
+                latency REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_date ON history(user_id, date);
+
+            -- Rollups maintained by add_history, so charts never scan the history table
+            CREATE TABLE IF NOT EXISTS history_daily (
+                user_id TEXT NOT NULL,
+                day TEXT NOT NULL,
+                generations INTEGER NOT NULL DEFAULT 0,
+                recipes INTEGER NOT NULL DEFAULT 0,
+                latency_sum REAL NOT NULL DEFAULT 0,
+                latency_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, day)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS history_ingredients (
+                user_id TEXT NOT NULL,
+                ingredient TEXT NOT NULL,
+                uses INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, ingredient)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_history_ingredients_uses ON history_ingredients(user_id, uses DESC);
+
+            -- Bumped on every history write; keys cached views of the rollups
+            CREATE TABLE IF NOT EXISTS history_versions (
+                user_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS history_recipes (
+                history_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                recipe_id TEXT NOT NULL REFERENCES bodies(hash),
+                PRIMARY KEY (history_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_recipes_recipe ON history_recipes(recipe_id);
+
+            CREATE VIEW IF NOT EXISTS favorite_documents AS
+                SELECT favorites.rowid AS rowid, favorites.title AS title,
+                       favorites.ingredients AS ingredients, body_search_text(bodies.data) AS body
+                FROM favorites JOIN bodies ON bodies.hash = favorites.recipe_id;
+        """)
+
+        if legacy:
+            self._migrate_v1(conn)
+        elif version == 2:
+            self._migrate_v2(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _migrate_v1(self, conn):
+        # v1 stored a full JSON copy of the recipe on every favorite and history row.
+        # The full-text index is rebuilt afterwards by _init_fts.
+        self.fts = False
+        with self._transaction():
+            for user_id, ingredients, date_saved, recipe in conn.execute(
+                "SELECT user_id, ingredients, date_saved, recipe FROM favorites_v1 ORDER BY rowid"
+            ).fetchall():
+                self.add_favorite(user_id, Recipe.from_dict(json.loads(recipe)), ingredients, date_saved)
+            for user_id, date, ingredients, recipes in conn.execute(
+                "SELECT user_id, date, ingredients, recipes FROM history_v1 ORDER BY rowid"
+            ).fetchall():
+                self.add_history(user_id, ingredients, [Recipe.from_dict(r) for r in json.loads(recipes)], date)
+            conn.execute("DROP TABLE favorites_v1")
+            conn.execute("DROP TABLE history_v1")
+
+    def _migrate_v2(self, conn):
+        # v2 history rows had no cuisine, diet or latency and no rollups
+        with self._transaction():
+            for column in ("cuisine TEXT NOT NULL DEFAULT ''", "diet TEXT NOT NULL DEFAULT ''", "latency REAL"):
+                conn.execute(f"ALTER TABLE history ADD COLUMN {column}")
+            self._rebuild_rollups(conn)
+
+    def _init_fts(self):
+        """Create the full-text index; returns ``False`` if FTS5 is unavailable."""
+        conn = self._conn()
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'favorites_fts'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            # External content: the index reads text from the bodies table, not a copy
+            conn.execute(
+                "CREATE VIRTUAL TABLE favorites_fts USING fts5("
+                "title, ingredients, body, content = 'favorite_documents', content_rowid = 'rowid', "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        except sqlite3.OperationalError:
+            return False
+
+        # Backfill recipes saved before the index existed
+        conn.execute("INSERT INTO favorites_fts (favorites_fts) VALUES ('rebuild')")
+        return True
+
+    # --- Bodies ---
+    def _put_body(self, conn, recipe):
+        conn.execute(
+            "INSERT OR IGNORE INTO bodies (hash, data) VALUES (?, ?)",
+            (recipe.id, compress_recipe(recipe)),
+        )
+
+    @timed("storage_seconds", op="get_recipe")
+    def _get_recipe(self, recipe_id):
+        row = self._conn().execute(
+            "SELECT data FROM bodies WHERE hash = ?", (recipe_id,)
+        ).fetchone()
+        return decompress_recipe(row[0]) if row else None
+
+    def _prune_bodies(self, conn, recipe_ids=None):
+        """Drop bodies no favorite or history entry refers to any more."""
+        unreferenced = (
+            "NOT EXISTS (SELECT 1 FROM favorites WHERE favorites.recipe_id = bodies.hash) "
+            "AND NOT EXISTS (SELECT 1 FROM history_recipes WHERE history_recipes.recipe_id = bodies.hash)"
+        )
+        if recipe_ids is None:
+            conn.execute(f"DELETE FROM bodies WHERE {unreferenced}")
+        else:
+            conn.executemany(
+                f"DELETE FROM bodies WHERE hash = ? AND {unreferenced}",
+                [(recipe_id,) for recipe_id in recipe_ids],
+            )
+
+    def put_recipe(self, recipe):
+        """Store a body ahead of the rows that will refer to it (imports)."""
+        with self._transaction() as conn:
+            self._put_body(conn, recipe)
+
+    def has_recipe(self, recipe_id):
+        # Unlike get_recipe this never caches a miss
+        return self._conn().execute(
+            "SELECT 1 FROM bodies WHERE hash = ?", (recipe_id,)
+        ).fetchone() is not None
+
+    def body_stats(self):
+        count, size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(length(data)), 0) FROM bodies"
+        ).fetchone()
+        return {"bodies": count, "bytes": size}
+
+    # --- Favorites ---
+    @timed("storage_seconds", op="add_favorite")
+    def add_favorite(self, user_id, recipe, ingredients="", date_saved=None):
+        """Save a recipe; returns ``False`` if the user already saved it."""
+        with self._transaction() as conn:
+            self._put_body(conn, recipe)
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO favorites (user_id, recipe_id, title, ingredients, date_saved) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (user_id, recipe.id, recipe.title, ingredients,
+                 date_saved or datetime.now().strftime("%Y-%m-%d")),
+            )
+            if cursor.rowcount and self.fts:
+                conn.execute(
+                    "INSERT INTO favorites_fts (rowid, title, ingredients, body) VALUES (?, ?, ?, ?)",
+                    (cursor.lastrowid, recipe.title, ingredients, search_text(recipe)),
+                )
+        return cursor.rowcount > 0
+
+    def _unindex(self, conn, where, params):
+        if self.fts:
+            conn.execute(
+                "INSERT INTO favorites_fts (favorites_fts, rowid, title, ingredients, body) "
+                "SELECT 'delete', rowid, title, ingredients, body FROM favorite_documents WHERE rowid IN ("
+                f"SELECT rowid FROM favorites WHERE {where})",
+                params,
+            )
+
+    @timed("storage_seconds", op="delete_favorite")
+    def delete_favorite(self, user_id, recipe_id):
+        with self._transaction() as conn:
+            self._unindex(conn, "user_id = ? AND recipe_id = ?", (user_id, recipe_id))
+            conn.execute(
+                "DELETE FROM favorites WHERE user_id = ? AND recipe_id = ?", (user_id, recipe_id)
+            )
+            self._prune_bodies(conn, [recipe_id])
+
+    @timed("storage_seconds", op="is_favorite")
+    def is_favorite(self, user_id, recipe_id):
+        row = self._conn().execute(
+            "SELECT 1 FROM favorites WHERE user_id = ? AND recipe_id = ?", (user_id, recipe_id)
+        ).fetchone()
+        return row is not None
+
+    def _search_clause(self, search):
+        """SQL filter for a search term: FTS5 when available, else a LIKE scan."""
+        if not search:
+            return "", ()
+        if self.fts:
+            query = fts_query(search)
+            if not query:
+                return "", ()
+            return " AND favorites_fts MATCH ?", (query,)
+        pattern = f"%{search.lower()}%"
+        return " AND (lower(title) LIKE ? OR lower(ingredients) LIKE ?)", (pattern, pattern)
+
+    def _search_join(self, search):
+        if search and self.fts and fts_query(search):
+            return " JOIN favorites_fts ON favorites_fts.rowid = favorites.rowid"
+        return ""
+
+    @timed("storage_seconds", op="count_favorites")
+    def count_favorites(self, user_id, search=None):
+        clause, params = self._search_clause(search)
+        return self._conn().execute(
+            f"SELECT COUNT(*) FROM favorites{self._search_join(search)} "
+            f"WHERE user_id = ?{clause}",
+            (user_id, *params),
+        ).fetchone()[0]
+
+    @timed("storage_seconds", op="list_favorites")
+    def list_favorites(self, user_id, search=None, order="Latest", limit=50, offset=0):
+        """A page of favorites without bodies; search results carry a highlighted ``snippet``."""
+        join = self._search_join(search)
+        clause, params = self._search_clause(search)
+        columns = "favorites.recipe_id, favorites.title, favorites.ingredients, favorites.date_saved"
+        if join:
+            # Title matches weigh most, then ingredients, then the recipe body
+            columns += f", snippet(favorites_fts, -1, '{_HIGHLIGHT_START}', '{_HIGHLIGHT_END}', '…', 12)"
+            order_by = "bm25(favorites_fts, 10.0, 5.0, 1.0)" if order == "Relevance" else FAVORITE_ORDERS[order]
+        else:
+            columns += ", NULL"
+            order_by = FAVORITE_ORDERS.get(order, FAVORITE_ORDERS["Latest"])
+        rows = self._conn().execute(
+            f"SELECT {columns} FROM favorites{join} "
+            f"WHERE user_id = ?{clause} ORDER BY {order_by} LIMIT ? OFFSET ?",
+            (user_id, *params, limit, offset),
+        ).fetchall()
+        favorites = []
+        for row in rows:
+            favorite = self._favorite(row)
+            if row[4]:
+                favorite["snippet"] = highlight(row[4])
+            favorites.append(favorite)
+        return favorites
+
+    @timed("storage_seconds", op="get_favorite")
+    def get_favorite(self, user_id, recipe_id):
+        """A single favorite with its recipe body loaded."""
+        row = self._conn().execute(
+            "SELECT recipe_id, title, ingredients, date_saved FROM favorites "
+            "WHERE user_id = ? AND recipe_id = ?",
+            (user_id, recipe_id),
+        ).fetchone()
+        if row is None:
+            return None
+        favorite = self._favorite(row)
+        favorite["recipe"] = self.get_recipe(recipe_id)
+        return favorite
+
+    def iter_favorites(self, user_id):
+        cursor = self._conn().execute(
+            "SELECT recipe_id, title, ingredients, date_saved FROM favorites "
+            "WHERE user_id = ? ORDER BY rowid",
+            (user_id,),
+        )
+        for row in cursor:
+            yield self._favorite(row)
+
+    @staticmethod
+    def _favorite(row):
+        return {
+            "id": row[0],
+            "title": row[1],
+            "ingredients": row[2],
+            "date_saved": row[3],
+        }
+
+    # --- History ---
+    @timed("storage_seconds", op="add_history")
+    def add_history(self, user_id, ingredients, recipes, date=None, cuisine="", diet="", latency=None):
+        """Record a generation; ``latency`` is seconds spent generating (``None`` when served from cache)."""
+        date = date or datetime.now().strftime("%Y-%m-%d %H:%M")
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO history (user_id, date, ingredients, recipe_count, cuisine, diet, latency) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, date, ingredients, len(recipes), cuisine or "", diet or "", latency),
+            )
+            for position, recipe in enumerate(recipes):
+                self._put_body(conn, recipe)
+                conn.execute(
+                    "INSERT INTO history_recipes (history_id, position, recipe_id) VALUES (?, ?, ?)",
+                    (cursor.lastrowid, position, recipe.id),
+                )
+            self._roll_up(conn, user_id, date, ingredients, len(recipes), latency)
+
+    def _roll_up(self, conn, user_id, date, ingredients, recipe_count, latency):
+        conn.execute(
+            "INSERT INTO history_daily (user_id, day, generations, recipes, latency_sum, latency_count) "
+            "VALUES (?, ?, 1, ?, ?, ?) ON CONFLICT (user_id, day) DO UPDATE SET "
+            "generations = generations + 1, recipes = recipes + excluded.recipes, "
+            "latency_sum = latency_sum + excluded.latency_sum, latency_count = latency_count + excluded.latency_count",
+            (user_id, date[:10], recipe_count, latency or 0.0, int(latency is not None)),
+        )
+        conn.executemany(
+            "INSERT INTO history_ingredients (user_id, ingredient, uses) VALUES (?, ?, 1) "
+            "ON CONFLICT (user_id, ingredient) DO UPDATE SET uses = uses + 1",
+            [(user_id, ingredient) for ingredient in ingredient_set(ingredients)],
+        )
+        self._bump_history_version(conn, user_id)
+
+    def _bump_history_version(self, conn, user_id):
+        conn.execute(
+            "INSERT INTO history_versions (user_id, version) VALUES (?, 1) "
+            "ON CONFLICT (user_id) DO UPDATE SET version = version + 1",
+            (user_id,),
+        )
+
+    def _clear_rollups(self, conn, user_id):
+        conn.execute("DELETE FROM history_daily WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM history_ingredients WHERE user_id = ?", (user_id,))
+        self._bump_history_version(conn, user_id)
+
+    def _rebuild_rollups(self, conn):
+        conn.execute("DELETE FROM history_daily")
+        conn.execute("DELETE FROM history_ingredients")
+        for user_id, date, ingredients, recipe_count, latency in conn.execute(
+            "SELECT user_id, date, ingredients, recipe_count, latency FROM history ORDER BY rowid"
+        ).fetchall():
+            self._roll_up(conn, user_id, date, ingredients, recipe_count, latency)
+
+    def history_version(self, user_id):
+        """Changes whenever the user's history does; a cache key for :meth:`history_daily` and friends."""
+        row = self._conn().execute(
+            "SELECT version FROM history_versions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    @timed("storage_seconds", op="history_daily")
+    def history_daily(self, user_id, days=None):
+        """Per-day generations, recipes and mean latency, oldest first.
+
+        With ``days``, only the last ``days`` calendar days (today included)
+        are returned; days without activity have no row.
+        """
+        # Rollup days are local dates, like the history timestamps they come from
+        since = (datetime.now().date() - timedelta(days=days - 1)).isoformat() if days else ""
+        rows = self._conn().execute(
+            "SELECT day, generations, recipes, latency_sum, latency_count FROM history_daily "
+            "WHERE user_id = ? AND day >= ? ORDER BY day DESC",
+            (user_id, since),
+        ).fetchall()
+        return [
+            {
+                "day": day,
+                "generations": generations,
+                "recipes": recipes,
+                "latency_sum": latency_sum,
+                "latency_count": latency_count,
+                "avg_latency": latency_sum / latency_count if latency_count else None,
+            }
+            for day, generations, recipes, latency_sum, latency_count in reversed(rows)
+        ]
+
+    def top_ingredients(self, user_id, limit=10):
+        return self._conn().execute(
+            "SELECT ingredient, uses FROM history_ingredients WHERE user_id = ? "
+            "ORDER BY uses DESC, ingredient LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+
+    @timed("storage_seconds", op="count_history")
+    def count_history(self, user_id):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM history WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+
+    @timed("storage_seconds", op="list_history")
+    def list_history(self, user_id, limit=100):
+        """Most recent ``limit`` generations (without bodies), returned oldest first."""
+        rows = self._conn().execute(
+            "SELECT rowid, date, ingredients, recipe_count, cuisine, diet, latency FROM history WHERE user_id = ? "
+            "ORDER BY rowid DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+        return [self._history(row) for row in reversed(rows)]
+
+    def has_history(self, user_id, date, ingredients, recipe_ids):
+        """Whether the user already has this exact generation (same date, ingredients and recipes)."""
+        rows = self._conn().execute(
+            "SELECT rowid FROM history WHERE user_id = ? AND date = ? AND ingredients = ?",
+            (user_id, date, ingredients),
+        ).fetchall()
+        return any(self.history_recipe_ids(row[0]) == list(recipe_ids) for row in rows)
+
+    def iter_history(self, user_id):
+        cursor = self._conn().execute(
+            "SELECT rowid, date, ingredients, recipe_count, cuisine, diet, latency FROM history WHERE user_id = ? ORDER BY rowid",
+            (user_id,),
+        )
+        for row in cursor:
+            yield self._history(row)
+
+    def history_recipe_ids(self, history_id):
+        return [row[0] for row in self._conn().execute(
+            "SELECT recipe_id FROM history_recipes WHERE history_id = ? ORDER BY position",
+            (history_id,),
+        )]
+
+    @staticmethod
+    def _history(row):
+        return {
+            "id": row[0],
+            "date": row[1],
+            "ingredients": row[2],
+            "recipe_count": row[3],
+            "cuisine": row[4],
+            "diet": row[5],
+            "latency": row[6],
+        }
+
+    def iter_user_recipe_ids(self, user_id):
+        """Every distinct recipe referenced by a user's favorites or history."""
+        cursor = self._conn().execute(
+            "SELECT recipe_id FROM favorites WHERE user_id = ? "
+            "UNION SELECT history_recipes.recipe_id FROM history_recipes "
+            "JOIN history ON history.rowid = history_recipes.history_id WHERE history.user_id = ?",
+            (user_id, user_id),
+        )
+        for row in cursor:
+            yield row[0]
+
+    # --- Bulk operations ---
+    @timed("storage_seconds", op="replace_all")
+    def replace_all(self, user_id, favorites=None, history=None):
+        """Replace a user's favorites and/or history in one transaction.
+
+        Favorites are ``{"recipe", "ingredients", "date_saved"}`` and history
+        entries ``{"recipes", "ingredients", "date"}`` with loaded recipes.
+        """
+        with self._transaction() as conn:
+            if favorites is not None:
+                self._unindex(conn, "user_id = ?", (user_id,))
+                conn.execute("DELETE FROM favorites WHERE user_id = ?", (user_id,))
+                for fav in favorites:
+                    self.add_favorite(user_id, fav["recipe"], fav["ingredients"], fav["date_saved"] or None)
+            if history is not None:
+                conn.execute(
+                    "DELETE FROM history_recipes WHERE history_id IN ("
+                    "SELECT rowid FROM history WHERE user_id = ?)",
+                    (user_id,),
+                )
+                conn.execute("DELETE FROM history WHERE user_id = ?", (user_id,))
+                self._clear_rollups(conn, user_id)
+                for entry in history:
+                    self.add_history(
+                        user_id, entry["ingredients"], entry["recipes"], entry["date"] or None,
+                        entry.get("cuisine", ""), entry.get("diet", ""), entry.get("latency"),
+                    )
+            self._prune_bodies(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Commit several writes together, or none of them if the block raises."""
+        with self._transaction():
+            yield
+
+    def prune_bodies(self):
+        with self._transaction() as conn:
+            self._prune_bodies(conn)
+
+    def clear(self, user_id):
+        self.replace_all(user_id, favorites=[], history=[])
@@ -0,0 +1,72 @@
+import pytest
+
+from allergens import validator_for
+
+
+@pytest.mark.parametrize("avoid, text, expected", [
+    # A safe phrase for one allergen must not hide another avoided item inside it
+    (["Dairy", "Tree Nuts"], "almond milk", {"tree nuts": "almond"}),
+    (["Dairy", "Soy"], "soy milk", {"soy": "soy"}),
+    (["Gluten", "Tree Nuts"], "almond flour", {"tree nuts": "almond"}),
+    (["coconut", "Dairy"], "coconut milk", {"coconut": "coconut"}),
+    (["Dairy", "peanut butter"], "peanut butter toast", {"peanut butter": "peanut butter"}),
+    # ...while still vouching for its own allergen
+    (["Dairy"], "coconut milk curry with peanut butter", {}),
+    (["Gluten"], "almond flour", {}),
+    (["Egg"], "roasted eggplant", {}),
+    (["Dairy"], "dairy-free cheese", {}),
+    (["Dairy"], "toast with butter", {"dairy": "butter"}),
+])
+def test_safe_phrases_only_cover_their_own_allergen(avoid, text, expected):
+    assert validator_for(avoid).scan(text) == expected
+
+
+@pytest.mark.parametrize("text, term", [
+    ("grilled salmon", "salmon"),
+    ("tuna salad", "tuna"),
+    ("anchovy dressing", "anchovy"),
+    ("garlic shrimp", "shrimp"),
+])
+def test_seafood_covers_fish_and_shellfish(text, term):
+    assert validator_for(["seafood"]).scan(text) == {"seafood": term}
+
+
+def test_seafood_keeps_safe_phrases():
+    assert validator_for(["seafood"]).scan("oyster mushroom risotto") == {}
+
+
+@pytest.mark.parametrize("avoid, text, term", [
+    # Derived forms of a term
+    ("Dairy", "buttered toast", "buttered"),
+    ("Dairy", "creamy mash", "creamy"),
+    ("Dairy", "milky tea", "milky"),
+    ("Dairy", "cheesy bake", "cheesy"),
+    ("Gluten", "breaded chicken", "breaded"),
+    # Compound words
+    ("Gluten", "cornbread", "bread"),
+    ("Gluten", "shortbread", "bread"),
+    ("Gluten", "flatbread", "bread"),
+    ("Gluten", "sourdough", "dough"),
+    ("Gluten", "wholewheat wrap", "wheat"),
+    ("Egg", "brush with eggwash", "eggwash"),
+    ("Fish", "codfish cakes", "fish"),
+    # Terms added to the tables
+    ("Gluten", "garlic naan", "naan"),
+    ("Gluten", "penne arrabbiata", "penne"),
+    ("Gluten", "macaroni cheese", "macaroni"),
+])
+def test_derived_and_compound_forms_are_caught(avoid, text, term):
+    assert validator_for([avoid]).scan(text) == {avoid.lower(): term}
+
+
+@pytest.mark.parametrize("avoid, text", [
+    ("Dairy", "no-cheese pizza"),
+    ("Dairy", "non-dairy creamer"),
+    ("Gluten", "buckwheat groats"),
+    ("Gluten", "thicken with cornflour"),
+    ("Gluten", "roasted cauliflower"),
+    ("Egg", "grilled eggplant"),
+    ("Fish", "shellfish stock"),
+])
+def test_absent_or_safe_mentions_pass(avoid, text):
+    assert validator_for([avoid]).scan(text) == {}
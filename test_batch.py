@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from batch import ADVANCED_DEFAULTS, normalize_request, request_key
+from cache import make_cache_key
+from ingredients import canonical_ingredients, load_vocabulary
+from similarity import constraint_key
+
+
+def test_batch_key_matches_app_key():
+    request = normalize_request({"ingredients": "Tomatoes, garlic, Aubergines", "avoid": "peanuts", "cuisine": "Italian"})
+    # The app: picked names plus custom entries mapped through the vocabulary
+    vocabulary = load_vocabulary()
+    all_ingredients = canonical_ingredients(["tomato", "garlic"] + [vocabulary.normalize("Aubergines")])
+    profile = {"preferred_cuisines": [], "skill_level": "Beginner"}
+    app_key = make_cache_key(all_ingredients, ["peanuts"], "Italian", "Any", "None", 3, profile, dict(ADVANCED_DEFAULTS),
+                             "model", structured=True)
+    assert request_key(request, "model") == app_key
+    assert request["ingredients"] == ["tomato", "garlic", "eggplant"]
+
+
+def test_batch_constraint_matches_app_constraint():
+    request = normalize_request({"ingredients": "tomato", "avoid": "Peanuts, dairy"})
+    profile = {"preferred_cuisines": [], "skill_level": "Beginner"}
+    assert constraint_key(request["avoid"], request["cuisine"], request["meal_type"], request["diet"], request["count"],
+                          request["user_profile"], request["advanced"], "model", structured=True) \
+        == constraint_key(["Peanuts", "dairy"], "Any", "Any", "None", 3, profile, dict(ADVANCED_DEFAULTS), "model", structured=True)
@@ -0,0 +1,228 @@
+"""Ingredient detection from fridge photos.
+
+Camera frames are several megabytes, so every photo is first downscaled to
+``MAX_SIDE`` pixels and recompressed as JPEG under ``MAX_BYTES``; only that
+copy is ever sent anywhere.  Detections are cached under a SHA-256 of
+that copy, so the same photo is never sent twice.  Within one user's
+scans they are also found by a 64-bit difference hash (dHash) of the image,
+which barely changes between retakes of the same fridge, so a retake within
+``HAMMING_THRESHOLD`` bits reuses the earlier answer instead of calling the
+model again.  Near matches never cross users, and flat images (dark,
+blurred or blank frames all hash to nearly 0) are only matched exactly.
+
+Detectors only need a ``name`` and ``detect(jpeg_bytes) -> [ingredient]``:
+:class:`GeminiDetector` asks a multimodal Gemini model and
+:class:`StubDetector` answers locally for tests and offline runs.
+"""
+
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+from metrics import inc, span
+
+
+MAX_SIDE = 1024
+MAX_BYTES = 250 * 1024
+JPEG_QUALITIES = (85, 75, 65, 55, 45)
+# dHash bits that may differ for two photos to count as the same fridge
+HAMMING_THRESHOLD = 6
+# dHashes with fewer set (or unset) bits than this come from featureless images
+MIN_HASH_BITS = 2 * HAMMING_THRESHOLD
+# Recent scans per user kept for near-hash matching
+RECENT_PER_SCOPE = 32
+MAX_INGREDIENTS = 25
+
+DETECTION_PROMPT = (
+    "List the distinct food ingredients visible in this photo of a fridge or pantry. "
+    "Use short, common ingredient names (e.g. \"eggs\", \"bell pepper\", \"cheddar\"), "
+    "skip brands, containers and anything you can't identify with confidence."
+)
+DETECTION_SCHEMA = {"type": "ARRAY", "items": {"type": "STRING"}}
+
+
+# --- Image preparation ---
+def prepare_image(data, max_side=MAX_SIDE, max_bytes=MAX_BYTES):
+    """Downscale and recompress raw image bytes; returns ``(jpeg_bytes, image)``.
+
+    Lower JPEG qualities are tried first, then smaller sizes, until the
+    result fits ``max_bytes``.
+    """
+    with span("image_prepare_seconds"):
+        image = Image.open(io.BytesIO(data))
+        # JPEGs can be decoded straight at a reduced scale, far cheaper than a full decode
+        image.draft("RGB", (max_side, max_side))
+        # Phones store rotation in EXIF; apply it before the metadata is dropped
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((max_side, max_side))
+        while True:
+            for quality in JPEG_QUALITIES:
+                buffer = io.BytesIO()
+                image.save(buffer, "JPEG", quality=quality, optimize=True)
+                if buffer.tell() <= max_bytes:
+                    return buffer.getvalue(), image
+            if min(image.size) <= 64:
+                return buffer.getvalue(), image
+            image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)))
+
+
+def dhash(image, size=8):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale copy."""
+    small = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = small.load()
+    bits = 0
+    for y in range(size):
+        for x in range(size):
+            bits = bits << 1 | (pixels[x, y] > pixels[x + 1, y])
+    return bits
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def is_distinctive(image_hash, bits=64):
+    """Whether a dHash carries enough detail to tell two photos apart."""
+    ones = bin(image_hash).count("1")
+    return MIN_HASH_BITS <= ones <= bits - MIN_HASH_BITS
+
+
+def parse_detection(text):
+    """Ingredient names from a detector response: a JSON list, ``{"ingredients": [...]}`` or a comma list."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = text.split(",")
+    if isinstance(data, dict):
+        data = data.get("ingredients", [])
+    if not isinstance(data, list):
+        return []
+    names = (str(item).strip().strip(".").lower() for item in data if isinstance(item, (str, int, float)))
+    return list(dict.fromkeys(name for name in names if name))[:MAX_INGREDIENTS]
+
+
+# --- Detectors ---
+class GeminiDetector:
+    """Asks a multimodal Gemini model (through a ``GeminiClient``) what's in the photo."""
+
+    def __init__(self, model):
+        self.model = model
+        self.name = f"gemini:{model.model_name}"
+
+    def detect(self, jpeg_bytes):
+        response = self.model.generate_content(
+            [{"mime_type": "image/jpeg", "data": jpeg_bytes}, DETECTION_PROMPT],
+            generation_config={
+                "response_mime_type": "application/json",
+                "response_schema": DETECTION_SCHEMA,
+                "max_output_tokens": 256,
+                "temperature": 0.2,
+            },
+        )
+        return parse_detection(response.text)
+
+
+class StubDetector:
+    """Local stand-in: returns ``ingredients`` if given, else a pick from ``vocabulary`` derived from the image bytes."""
+
+    name = "stub"
+    DEFAULT_VOCABULARY = ("eggs", "milk", "cheese", "tomato", "spinach", "carrot", "chicken", "lemon", "yogurt", "butter")
+
+    def __init__(self, ingredients=None, vocabulary=DEFAULT_VOCABULARY, count=4):
+        self.ingredients = ingredients
+        self.vocabulary = vocabulary
+        self.count = count
+        self.calls = 0
+
+    def detect(self, jpeg_bytes):
+        self.calls += 1
+        if self.ingredients is not None:
+            return list(self.ingredients)
+        digest = hashlib.sha256(jpeg_bytes).digest()
+        start = digest[0] % len(self.vocabulary)
+        return [self.vocabulary[(start + i) % len(self.vocabulary)] for i in range(min(self.count, len(self.vocabulary)))]
+
+
+# --- Cache and pipeline ---
+class DetectionCache:
+    """Bounded LRU of detections per detector.
+
+    Entries are keyed by the SHA-256 of the prepared image, which is safe to
+    share between users.  Near-identical dHashes are only looked up among
+    the recent scans of the same ``scope`` (a user or session id).
+    """
+
+    def __init__(self, max_entries=512, threshold=HAMMING_THRESHOLD, recent_per_scope=RECENT_PER_SCOPE):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.recent_per_scope = recent_per_scope
+        self._entries = OrderedDict()
+        # scope -> OrderedDict of (detector, dHash) -> digest
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _nearest(self, detector_name, image_hash, scope):
+        if scope is None or not is_distinctive(image_hash):
+            return None
+        recent = self._recent.get(scope, {})
+        candidates = [(hamming(h, image_hash), digest) for (name, h), digest in recent.items()
+                      if name == detector_name and is_distinctive(h)]
+        distance, digest = min(candidates, default=(None, None))
+        return digest if distance is not None and distance <= self.threshold else None
+
+    def get(self, detector_name, digest, image_hash=None, scope=None):
+        with self._lock:
+            key = (detector_name, digest)
+            if key not in self._entries and image_hash is not None:
+                key = (detector_name, self._nearest(detector_name, image_hash, scope))
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return list(self._entries[key])
+
+    def put(self, detector_name, digest, ingredients, image_hash=None, scope=None):
+        with self._lock:
+            self._entries[(detector_name, digest)] = list(ingredients)
+            self._entries.move_to_end((detector_name, digest))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if scope is not None and image_hash is not None:
+                recent = self._recent.setdefault(scope, OrderedDict())
+                self._recent.move_to_end(scope)
+                recent[(detector_name, image_hash)] = digest
+                recent.move_to_end((detector_name, image_hash))
+                while len(recent) > self.recent_per_scope:
+                    recent.popitem(last=False)
+                while len(self._recent) > self.max_entries:
+                    self._recent.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def detect_ingredients(data, detector, cache=None, scope=None):
+    """Run the photo pipeline on raw image bytes.
+
+    ``scope`` (a user or session id) lets retakes of that scope's earlier
+    photos reuse their detections.  Returns ``{"ingredients", "cached",
+    "original_bytes", "sent_bytes"}``; ``sent_bytes`` is 0 when the answer
+    came from the cache.
+    """
+    jpeg, image = prepare_image(data)
+    digest = hashlib.sha256(jpeg).hexdigest()
+    image_hash = dhash(image)
+    ingredients = cache.get(detector.name, digest, image_hash, scope) if cache is not None else None
+    if ingredients is not None:
+        inc("image_detections_total", result="hit")
+        return {"ingredients": ingredients, "cached": True, "original_bytes": len(data), "sent_bytes": 0}
+
+    inc("image_detections_total", result="miss")
+    with span("image_detect_seconds", detector=detector.name):
+        ingredients = detector.detect(jpeg)
+    if cache is not None:
+        cache.put(detector.name, digest, ingredients, image_hash, scope)
+    return {"ingredients": ingredients, "cached": False, "original_bytes": len(data), "sent_bytes": len(jpeg)}